@@ -3,9 +3,6 @@ import os
 
 import local_config
 
-# uncomment this if using MAX-31856
-# from lib.max31856 import MAX31856
-
 ########################################################################
 #   General options
 
@@ -46,9 +43,22 @@ integral_limits = (0, 100)
 # temperature_average_samples times during and the average value is used.
 sensor_time_wait = 1
 
+# Ticks of the control loop are due every sensor_time_wait seconds on a fixed schedule. When a tick
+# runs past the next one, e.g. on a busy Pi, "skip" drops the missed ticks and continues with the next
+# one that is still ahead, "catch_up" runs the missed ticks right away, back to back, as long as no more
+# than loop_max_catch_up were missed, further behind it skips as well. A stall counts as one overrun, and
+# the PID sees the ticks it catches up on time_step apart.
+loop_overrun_policy = "skip"
+loop_max_catch_up = 3
+
 # update temperature at this interval when not actively running a profile.
 idle_sample_time = 2
 
+# oven_update frames only carry the fields that changed, with a full keyframe every this many frames.
+telemetry_keyframe_interval = 30
+# send oven_update frames as MessagePack instead of json, smaller but needs the msgpack package.
+telemetry_msgpack = False
+
 # abort if we've applied heat and temperature is 50 deg below setpoint for this many minutes.
 abort_threshold_minutes = 1
 # abort if heating for more than the above number of minutes and temp is off by this much or more.
@@ -105,7 +115,22 @@ thermocouple_offset = 0
 # you will likely need to increase this (eg I use 40)
 temperature_average_samples = 40
 
-# Thermocouple AC frequency filtering - set to True if in a 50Hz locale, else leave at False for 60Hz locale
+# seconds between thermocouple readings
+temperature_sample_interval = 0.25
+
+# every reading goes through these filters in order, the kiln temperature is the output of the last one.
+# trimmed_mean: mean of the last window readings without the lowest and highest chop percent
+# median: replaces readings more than threshold degrees from the median of the last size readings (spikes)
+# ema: exponential moving average, alpha is the weight of the newest reading
+# kalman: kalman filter, process_variance is how much the temperature changes between readings and
+#         measurement_variance how noisy the readings are
+# e.g. [("median", {"size": 5, "threshold": 50}), ("kalman", {"process_variance": 0.05, "measurement_variance": 4})]
+temperature_filters = [
+    ("trimmed_mean", {"window": 12, "chop": 20}),  # 3 seconds of readings
+]
+
+# Mains frequency - set to True if in a 50Hz locale, else leave at False for 60Hz locale.
+# Used for the max31856 noise filter and to align SSR switching with mains cycles.
 ac_freq_50hz = False
 
 ########################################################################
@@ -119,10 +144,36 @@ ac_freq_50hz = False
 # Outputs
 gpio_heat = 23  # Switches zero-cross solid-state-relay
 
+# How the SSR follows the PID output, switching runs in the background.
+# "time_proportional": on for output * ssr_window seconds, then off, every ssr_window seconds.
+# "burst": on or off for every ssr_burst_cycles mains cycles, with the on cycles spread evenly
+#          (30% is 3 of every 10). Smoother, but needs a zero-cross SSR, never use it with a contactor.
+ssr_mode = "time_proportional"
+ssr_window = 1  # seconds, rounded to whole mains cycles
+ssr_burst_cycles = 1
+
+# Thermocouple board, "max31855" or "max31856"
+thermocouple_board = "max31855"
+
 # Thermocouple Connection (using bitbang interfaces)
 gpio_sensor_cs = 27
 gpio_sensor_clock = 22
 gpio_sensor_data = 17
+gpio_sensor_di = 10  # only used with max31856
+
+# thermocouple board interface, "bitbang" uses the gpio pins above, "spi" reads the board on the hardware
+# SPI bus with one transfer per sample (enable SPI with raspi-config and install spidev).
+thermocouple_interface = "bitbang"
+# SPI bus and chip select for the "spi" interface, 0 and 0 are SCLK (GPIO 11), MISO (GPIO 9),
+# MOSI (GPIO 10, max31856 only) and CE0 (GPIO 8)
+spi_bus = 0
+spi_device = 0
+
+# max31856 only: thermocouple type, one of B, E, J, K, N, R, S or T
+thermocouple_type = "K"
+# max31856 only: conversions averaged on the chip, 1, 2, 4, 8 or 16. The chip converts continuously, more
+# averaging gives quieter readings at a lower rate, so the temperature_filters above can be lighter.
+thermocouple_hardware_averaging = 4
 
 ########################################################################
 # Emergencies - or maybe not
@@ -158,4 +209,41 @@ emergency_shutoff_temp = 1200  # don't go above 1200, glass never needs heating
 # See https://github.com/jbruce12000/kiln-profiles
 kiln_profiles_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), "storage", "profiles"))
 
+# duration, peak temperature, ramp rates and an estimated cost of every profile are cached here,
+# the estimate comes from simulating the profile with the simulation parameters above, the ones of this
+# file: settings a kiln overrides in kilns don't change it. Missing estimates are computed in the background.
+profile_index_file = os.path.abspath(os.path.join(os.path.dirname(__file__), "storage", "profile_index.json"))
+
+# every firing is recorded in this SQLite database, so past firings can be listed and plotted after a restart.
+# set to None to disable.
+firing_history_file = os.path.abspath(os.path.join(os.path.dirname(__file__), "storage", "firing_history.db"))
+
+# a running firing is checkpointed to this file every checkpoint_interval seconds. If the controller restarts
+# during a firing, for example after a power cut, the firing is resumed where it was on startup if the controller
+# was down for less than resume_max_downtime seconds and the kiln cooled less than resume_temperature_band degrees.
+# set checkpoint_file to None to disable.
+checkpoint_file = os.path.abspath(os.path.join(os.path.dirname(__file__), "storage", "checkpoint.json"))
+checkpoint_interval = 10
+resume_max_downtime = 15 * 60
+resume_temperature_band = 50
+
+# one controller can run several kilns. Every kiln has an id and a dict of the settings in this file that are
+# different for it, e.g. its GPIO pins, thermocouple board, PID gains and elements:
+#
+# kilns = {
+#     "big": {},
+#     "test": {"gpio_heat": 24, "gpio_sensor_cs": 8, "pid_kp": 15, "kw_elements": 1.8},
+# }
+#
+# Clients pick a kiln by id, the first one is the default. With more than one kiln, every kiln gets its own
+# firing_history_file and checkpoint_file, named after the kiln id, unless they are set in its settings.
+kilns = {"kiln": {}}
+
+# the /admin endpoints take CPU profiles and memory snapshots of the running controller, written to
+# diagnostics_directory, see the README. Requests must send admin_token in the X-Admin-Token header,
+# None disables the endpoints. A CPU profile runs for at most profile_max_seconds.
+admin_token = None
+diagnostics_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), "storage", "diagnostics"))
+profile_max_seconds = 300
+
 
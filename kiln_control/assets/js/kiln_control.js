@@ -3,6 +3,9 @@ let currentState = "----";
 let lastState = "";
 let graph = {profile: {}, live: {}};
 let profiles = [];
+// revision of the profile list and the server process it came from
+let profileEpoch = null;
+let profileRevision = 0;
 let selectedProfile = 0;
 let selectedProfileName = "";
 // F or C
@@ -13,6 +16,12 @@ let timeScaleLong = "";
 let tempScaleDisplay = "";
 let kwh_rate = 0.0;
 let currency_type = "$";
+// oven_update frames: field order from the config, last sequence number and values seen
+let telemetryFields = [];
+let telemetrySeq = null;
+let telemetryValues = null;
+// kiln this page follows, from the kiln url parameter, null for the default one
+let kilnId = new URLSearchParams(window.location.search).get('kiln');
 
 const RUNNING = "RUNNING";
 const IDLE = "IDLE";
@@ -39,6 +48,11 @@ function updateProfile(profileId) {
     let job_seconds = profile.data.length === 0 ? 0 : parseInt(profile.data[profile.data.length - 1][0]);
     let kwh = (3850 * job_seconds / 3600 / 1000).toFixed(2);
     let cost = (kwh * kwh_rate).toFixed(2);
+    // use the server's simulated estimate when available, a simulation that didn't finish only covers part of it
+    if (profile.summary && profile.summary.estimated_state === "COMPLETE") {
+        kwh = profile.summary.estimated_kwh.toFixed(2);
+        cost = profile.summary.estimated_cost.toFixed(2);
+    }
     let job_time = new Date(job_seconds * 1000).toISOString().slice(11, 19);
     document.getElementById('sel_prof').textContent = profile.name;
     document.getElementById('sel_prof_eta').textContent = job_time;
@@ -402,7 +416,7 @@ function updateGraphWithLogData(logData) {
 }
 
 
-function updateRunIndicator(isSimulation, state) {
+function updateRunIndicator(isSimulation, state, speed) {
     const icon = document.getElementById('run_icon');
     const text = document.getElementById('run_text');
     const progressBar = document.getElementById('progressBar');
@@ -418,7 +432,7 @@ function updateRunIndicator(isSimulation, state) {
     // Setting styles specific to RUNNING state
     if (state === RUNNING) {
         icon.innerHTML = isSimulation ? '🎛️' : '🔥';
-        text.innerHTML = isSimulation ? 'Running Simulation' : 'Heating Kiln';
+        text.innerHTML = isSimulation ? `Running Simulation (${speed ? speed + 'x' : 'max speed'})` : 'Heating Kiln';
         text.style.color = isSimulation ? '#4aa3c4FF' : '#e70808';
         progressBar.style.backgroundColor = isSimulation ? '#4AA3C4' : '#e70808';
     }
@@ -483,16 +497,18 @@ $(document).ready(function () {
         console.log("Connected to server via Socket.IO");
         graph.live.data.length = 0; // Clear the history line
 
-        console.log("Request Config Data")
-        socket.emit('request_config'); // Request initial config on first connection
-        socket.emit('request_backlog'); // Request initial backlog data on first connection
-        socket.emit('request_profiles');
+        console.log("Request Bootstrap Data")
+        // Request config, profiles and backlog of the kiln in one go, this also follows its updates
+        socket.emit('bootstrap', kilnId === null ? {} : {"kiln": kilnId});
     });
 
-    socket.on('oven_update', handleStatusUpdate);
+    socket.on('bootstrap', handleBootstrap);
+
+    socket.on('oven_update', handleTelemetryFrame);
     socket.on('backlog_data', handleBacklogData);
     socket.on('get_config', updateConfigDisplay);
     socket.on('profile_list', handleProfileList);
+    socket.on('profile_changes', handleProfileChanges);
     socket.on('server_response', handleServerResponse)
     socket.on('error', handleServerResponse)
 
@@ -544,7 +560,7 @@ $(document).ready(function () {
 
     function runTaskSimulation() {
         let cmd = {
-            "cmd": "SIMULATE", "profile": profiles[selectedProfile]
+            "cmd": "SIMULATE", "profile": profiles[selectedProfile], "speed": $('#simulateSpeed').val()
         };
 
         graph.live.data.length = 0;
@@ -559,6 +575,38 @@ $(document).ready(function () {
         socket.emit('control', cmd);
     }
 
+    function handleTelemetryFrame(payload) {
+        // keyframes are [0, seq, values...], deltas are [1, seq, index, value, index, value...]
+        let frame = typeof payload === "string" ? JSON.parse(payload) : MessagePack.decode(new Uint8Array(payload));
+        let seq = frame[1];
+        if (frame[0] === 0) {
+            telemetryValues = frame.slice(2);
+        } else if (telemetryValues === null || seq !== telemetrySeq + 1) {
+            // missed a frame, ask for the full status
+            if (telemetryValues !== null || telemetrySeq === null) {
+                socket.emit('request_keyframe');
+            }
+            telemetryValues = null;
+            telemetrySeq = seq;
+            return;
+        } else {
+            for (let i = 2; i < frame.length; i += 2) {
+                telemetryValues[frame[i]] = frame[i + 1];
+            }
+        }
+        telemetrySeq = seq;
+        if (telemetryFields.length === 0) {
+            // field names come with the config
+            return;
+        }
+
+        let statusData = {};
+        telemetryFields.forEach(function (field, i) {
+            statusData[field] = telemetryValues[i];
+        });
+        handleStatusUpdate(statusData);
+    }
+
     function handleStatusUpdate(statusData) {
         // console.log('handleStatusUpdate:' + JSON.stringify(statusData));
 
@@ -611,7 +659,7 @@ $(document).ready(function () {
         $("#nav_start").hide();
         $("#nav_stop").show();
 
-        updateRunIndicator(data.is_simulation, data.state); // Pass the isSimulation flag and state
+        updateRunIndicator(data.is_simulation, data.state, data.speed); // Pass the isSimulation flag, state and speed
         graph.live.data.push([data.time_stamp, data.temperature]);
         graph.plot = $.plot("#graph_container", [graph.profile, graph.live], getOptions());
 
@@ -639,7 +687,7 @@ $(document).ready(function () {
         // Update UI for non-running state
         $("#nav_start").show();
         $("#nav_stop").hide();
-        updateRunIndicator(data.is_simulation, data.state);
+        updateRunIndicator(data.is_simulation, data.state, data.speed);
         $('#state').html('<p class="ds-text">' + currentState + '</p>');
 
         // Reset progress bar if idle
@@ -648,8 +696,29 @@ $(document).ready(function () {
         }
     }
 
+    function handleBootstrap(data) {
+        console.log('handleBootstrap');
+        let bootstrap = JSON.parse(data);
+        updateKilnSelector(bootstrap.kiln, bootstrap.kilns);
+        updateConfigDisplay(bootstrap.config);
+        handleProfileList(bootstrap.profile_list);
+        handleBacklogData(bootstrap.backlog);
+    }
+
+    function updateKilnSelector(current, kilns) {
+        // only shown if the controller runs more than one kiln, picking one reloads the page for it
+        let kilnSelector = $('#kilnSelector');
+        kilnSelector.empty().toggle(kilns.length > 1);
+        kilns.forEach(function (id) {
+            kilnSelector.append($('<option></option>').val(id).text(id).prop('selected', id === current));
+        });
+        kilnSelector.off('change').on('change', function () {
+            window.location.search = '?kiln=' + encodeURIComponent(kilnSelector.val());
+        });
+    }
+
     function handleBacklogData(data) {
-        console.log("handleBacklogData" + JSON.stringify(data))
+        console.log("handleBacklogData")
         updateSelectedProfile(data.profile);
         updateGraphWithLogData(data.log);
     }
@@ -662,6 +731,7 @@ $(document).ready(function () {
         timeScaleProfile = configData.time_scale_profile;
         kwh_rate = configData.kwh_rate;
         currency_type = configData.currency_type;
+        telemetryFields = configData.telemetry_fields;
 
         tempScaleDisplay = tempScale === "c" ? "C" : "F";
 
@@ -746,20 +816,47 @@ $(document).ready(function () {
     function handleProfileList(storageData) {
         // Check if the message is a response or an error
         console.log('handleProfileList');
-        console.log(storageData)
         try {
-            let profilesArray = JSON.parse(storageData);
-            if (Array.isArray(profilesArray)) {
-                profiles = profilesArray;
+            let profileList = typeof storageData === "string" ? JSON.parse(storageData) : storageData;
+            if (Array.isArray(profileList.profiles)) {
+                profiles = profileList.profiles;
+                profileEpoch = profileList.epoch;
+                profileRevision = profileList.revision;
                 updateProfileSelector();
             } else {
-                console.error("Received data is not an array.");
+                console.error("Received data has no profile array.");
             }
         } catch (error) {
             console.error("Error parsing received data: ", error);
         }
     }
 
+    function handleProfileChanges(data) {
+        console.log('handleProfileChanges');
+        let changes = data.changes.filter(change => change.revision > profileRevision);
+        if (data.epoch !== profileEpoch || (changes.length > 0 && changes[0].revision !== profileRevision + 1)) {
+            // we missed something, catch up from our revision
+            socket.emit('request_profile_changes', {"epoch": profileEpoch, "since": profileRevision});
+            return;
+        }
+
+        changes.forEach(function (change) {
+            let index = profiles.findIndex(profile => profile.name === change.name);
+            if (change.action === "removed") {
+                if (index !== -1) profiles.splice(index, 1);
+            } else if (index !== -1) {
+                profiles[index] = change.profile;
+            } else {
+                profiles.push(change.profile);
+            }
+            profileRevision = change.revision;
+        });
+
+        if (changes.length > 0 && currentState !== "EDIT") {
+            updateProfileSelector();
+        }
+    }
+
     function deleteProfile() {
 
         console.log("Delete profile:" + selectedProfileName);
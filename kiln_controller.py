@@ -1,18 +1,25 @@
+import hmac
 import json
 import logging
 import os
 
-from flask import Flask, abort, redirect, send_from_directory
-from flask_socketio import SocketIO, emit
+from flask import Flask, Response, abort, redirect, request, send_from_directory
+from flask_socketio import SocketIO, emit, join_room, leave_room
 
 import config_file
+from lib.diagnostics import MemorySnapshots, SamplingProfiler
+from lib.kiln_registry import KilnRegistry
+from lib.metrics import Registry
 from lib.oven_factory import OvenFactory
-from lib.oven_watcher import OvenWatcher
 from lib.profile import Profile
+from lib.profile_index import ProfileIndex
 from lib.profile_manager import ProfileManager
+from lib.telemetry import FIELDS as TELEMETRY_FIELDS
 
 log = logging.getLogger(__name__)
 
+OVEN_STATES = ("IDLE", "RUNNING", "COMPLETE", "ABORTED")
+
 
 class KilnController:
 
@@ -21,7 +28,10 @@ class KilnController:
         logging.basicConfig(level=configuration.log_level, format=configuration.log_format)
         self.config = configuration
         log.info("Initializing the kiln controller")
-        self.prof_man = ProfileManager(self.config.kiln_profiles_directory)
+        # summaries computed in the background are sent to the clients as profile changes
+        self.prof_man = ProfileManager(self.config.kiln_profiles_directory,
+                                       ProfileIndex(self.config, self.config.profile_index_file),
+                                       on_change=self.broadcast_profile_changes)
 
         self.script_dir = os.path.dirname(os.path.realpath(__file__))
         self.profile_path = self.config.kiln_profiles_directory
@@ -29,12 +39,24 @@ class KilnController:
         self.flask_app = Flask(__name__)
         self.socketio = SocketIO(self.flask_app, cors_allowed_origins="*", logger=False, engineio_logger=False)
 
-        # Initialize with the simulated oven
-        self.oven = OvenFactory.create_oven(OvenFactory.SIMULATED, self.config)
+        # bootstrap messages served from the cached snapshot and rebuilt
+        self.bootstrap_hits = self.bootstrap_misses = 0
+        # connected Socket.IO clients and the kiln each of them follows
+        self.clients = 0
+        self.client_kilns = {}
+
+        # every kiln with its own oven and watcher, interrupted firings are resumed on start
+        self.kilns = KilnRegistry(self.config, self.socketio)
+        self.kilns.start()
 
-        # Create OvenWatcher instance with oven and socketio
-        self.oven_watcher = OvenWatcher(self.oven, self.config, self.socketio)
-        self.oven_watcher.start()
+        self.metrics = self.create_metrics()
+
+        # on-demand CPU profiles and memory snapshots, only with an admin token
+        self.profiler = self.memory_snapshots = None
+        if self.config.admin_token:
+            os.makedirs(self.config.diagnostics_directory, exist_ok=True)
+            self.profiler = SamplingProfiler(self.config.diagnostics_directory, self.config.profile_max_seconds)
+            self.memory_snapshots = MemorySnapshots(self.config.diagnostics_directory)
 
         @self.flask_app.route('/')
         def index():
@@ -45,18 +67,130 @@ class KilnController:
             log.debug(f"serving {filename}")
             return send_from_directory(os.path.join(self.script_dir, "kiln_control"), filename)
 
+        @self.flask_app.route('/api/kilns')
+        def kilns():
+            return {'kilns': self.get_kiln_list()}
+
+        @self.flask_app.route('/api/loop_stats')
+        def loop_stats():
+            kiln = self.kilns.get(request.args.get('kiln'))
+            if kiln is None:
+                abort(404, f"Unknown kiln: {request.args.get('kiln')}")
+            return kiln.oven.get_loop_stats()
+
+        @self.flask_app.route('/metrics')
+        def metrics():
+            return Response(self.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+        @self.flask_app.route('/admin/profile', methods=['GET'])
+        def profile_status():
+            self.check_admin()
+            return self.profiler.get_status()
+
+        @self.flask_app.route('/admin/profile/start', methods=['POST'])
+        def profile_start():
+            self.check_admin()
+            try:
+                seconds = float(request.args.get('seconds', 30))
+                interval = float(request.args.get('interval', 0.01))
+            except ValueError:
+                abort(400, "seconds and interval must be numbers")
+            try:
+                file_name = self.profiler.start(seconds, interval)
+            except ValueError as e:
+                abort(409, str(e))
+            return dict(self.profiler.get_status(), file=file_name)
+
+        @self.flask_app.route('/admin/profile/stop', methods=['POST'])
+        def profile_stop():
+            self.check_admin()
+            self.profiler.stop()
+            return self.profiler.get_status()
+
+        @self.flask_app.route('/admin/memory/snapshot', methods=['POST'])
+        def memory_snapshot():
+            self.check_admin()
+            file_name = self.memory_snapshots.snapshot()
+            return dict(self.memory_snapshots.get_status(), file=file_name)
+
+        @self.flask_app.route('/admin/memory/stop', methods=['POST'])
+        def memory_stop():
+            self.check_admin()
+            self.memory_snapshots.stop()
+            return self.memory_snapshots.get_status()
+
+        @self.flask_app.route('/admin/files/<path:filename>')
+        def diagnostics_file(filename):
+            self.check_admin()
+            return send_from_directory(self.config.diagnostics_directory, filename, as_attachment=True)
+
+        @self.socketio.on('connect')
+        def handle_connect():
+            # clients follow the default kiln until they pick one
+            self.clients += 1
+            self.follow_kiln(self.kilns.get())
+
+        @self.socketio.on('disconnect')
+        def handle_disconnect(*args):
+            self.clients -= 1
+            self.client_kilns.pop(request.sid, None)
+
+        @self.socketio.on('select_kiln')
+        def handle_select_kiln(msgdict):
+            # follow the updates of a kiln without the whole bootstrap, answered with its config
+            kiln = self.get_kiln(msgdict)
+            if kiln:
+                self.follow_kiln(kiln)
+                emit('get_config', self.get_config(kiln))
+
+        @self.socketio.on('request_kilns')
+        def handle_request_kilns():
+            emit('kiln_list', self.get_kiln_list())
+
         @self.socketio.on('request_backlog')
-        def handle_request_backlog():
-            self.oven_watcher.send_backlog()  # Or modify to send to specific client
+        def handle_request_backlog(msgdict=None):
+            kiln = self.get_kiln(msgdict)
+            if kiln:
+                kiln.watcher.send_backlog(request.sid)
+
+        @self.socketio.on('request_keyframe')
+        def handle_request_keyframe(msgdict=None):
+            # a client missed an oven_update frame, send it the full current status
+            kiln = self.get_kiln(msgdict)
+            keyframe = kiln.watcher.telemetry.keyframe() if kiln else None
+            if keyframe is not None:
+                emit('oven_update', keyframe)
+
+        @self.socketio.on('bootstrap')
+        def handle_bootstrap(msgdict=None):
+            # everything a connecting client needs in one message, to that client only. Naming a kiln follows it.
+            log.info(f"bootstrap requested by {request.sid}: {msgdict}")
+            kiln = self.get_kiln(msgdict)
+            if kiln:
+                self.follow_kiln(kiln)
+                emit('bootstrap', self.get_bootstrap(kiln))
 
         @self.socketio.on('request_profiles')
         def handle_request_profiles():
             log.info('request_profiles.')
             emit('profile_list', self.prof_man.get_profiles())
 
+        @self.socketio.on('request_profile_changes')
+        def handle_request_profile_changes(msgdict):
+            # clients that missed a change catch up from their revision, or get the whole list if it's too old.
+            log.info(f"request_profile_changes: {msgdict}")
+            changes = self.prof_man.get_changes(msgdict.get('since', 0), msgdict.get('epoch'))
+            if changes is None:
+                emit('profile_list', self.prof_man.get_profiles())
+            else:
+                emit('profile_changes', changes)
+
         @self.socketio.on('control')
         def handle_control(json_data):
             log.debug("WebSocket (control) received: %s" % json_data)
+            kiln = self.get_kiln(json_data)
+            if kiln is None:
+                return
             try:
                 # Parse the received data
                 command = json_data.get("cmd")
@@ -70,17 +204,21 @@ class KilnController:
                 # Handle different commands
                 if command == "RUN":
                     log.debug("RUN command received")
-                    self.initialize_and_run_oven(OvenFactory.REAL, profile)
+                    self.initialize_and_run_oven(kiln, OvenFactory.REAL, profile)
 
                 elif command == "SIMULATE":
                     log.debug("SIMULATE command received")
-                    self.initialize_and_run_oven(OvenFactory.SIMULATED, profile)
+                    speed = self.parse_speed(json_data.get("speed", 1))
+                    if speed is False:
+                        emit('error', {'message': f"Invalid simulation speed: {json_data.get('speed')}"})
+                        return
+                    self.initialize_and_run_oven(kiln, OvenFactory.SIMULATED, profile, speed)
 
                 elif command == "STOP":
                     log.info("Stop command received")
-                    if self.oven:
+                    if kiln.oven:
                         log.info("Oven Exists")
-                        self.oven.stop()
+                        kiln.oven.stop()
                     else:
                         log.error("No oven initialized.")
                         emit('error', {'message': 'No oven initialized'})
@@ -94,10 +232,11 @@ class KilnController:
             log.debug(f"Profile to be saved received: {msgdict}")
             try:
                 # Process the storage command and send response back
+                revision = self.prof_man.revision
                 success = self.prof_man.save_profile(msgdict)
                 if success:
                     response = {'status': 'success', 'message': 'Profile saved successfully'}
-                    emit('profile_list', self.prof_man.get_profiles())
+                    self.broadcast_profile_changes(revision)
                 else:
                     response = {'status': 'failure', 'message': 'Failed to save profile'}
                 emit('server_response', response)
@@ -110,10 +249,11 @@ class KilnController:
             log.info(f"Profile to be deleted: {profile_name}")
             try:
                 # Process the storage command and send response back
+                revision = self.prof_man.revision
                 success = self.prof_man.delete_profile(profile_name)
                 if success:
                     response = {'status': 'success', 'message': 'Profile deleted.'}
-                    emit('profile_list', self.prof_man.get_profiles())
+                    self.broadcast_profile_changes(revision)
                 else:
                     response = {'status': 'failure', 'message': 'Failed to delete profile'}
                 emit('server_response', response)
@@ -121,47 +261,188 @@ class KilnController:
                 log.error(f"Error processing profile delete: {error}")
                 emit('error', {'message': 'Error processing profile delete'})
 
+        @self.socketio.on('request_firings')
+        def handle_request_firings(msgdict=None):
+            # past firings, newest first, optionally of one profile or started in a time range (epoch seconds)
+            msgdict = msgdict or {}
+            kiln = self.get_kiln(msgdict)
+            if kiln is None:
+                return
+            if kiln.firing_store is None:
+                emit('error', {'message': 'Firing history is disabled'})
+                return
+            emit('firing_list', kiln.firing_store.list_runs(msgdict.get('profile'), msgdict.get('since'),
+                                                            msgdict.get('until'), msgdict.get('limit', 100)))
+
+        @self.socketio.on('request_firing')
+        def handle_request_firing(msgdict):
+            # the samples of one firing, optionally only between time_stamps start and end
+            kiln = self.get_kiln(msgdict)
+            if kiln is None:
+                return
+            if kiln.firing_store is None:
+                emit('error', {'message': 'Firing history is disabled'})
+                return
+            run = kiln.firing_store.get_run(msgdict.get('id'))
+            if run is None:
+                emit('error', {'message': f"Unknown firing: {msgdict.get('id')}"})
+                return
+            run['log'] = kiln.firing_store.get_samples(run['id'], msgdict.get('start'), msgdict.get('end'),
+                                                       msgdict.get('max_points', 500))
+            emit('firing_data', run)
+
+        @self.socketio.on('request_sensor_stats')
+        def handle_request_sensor_stats(msgdict=None):
+            kiln = self.get_kiln(msgdict)
+            if kiln:
+                emit('sensor_stats', kiln.oven.temp_sensor.get_stats())
+
+        @self.socketio.on('request_loop_stats')
+        def handle_request_loop_stats(msgdict=None):
+            kiln = self.get_kiln(msgdict)
+            if kiln:
+                emit('loop_stats', kiln.oven.get_loop_stats())
+
         @self.socketio.on('request_config')
-        def _handle_config():
+        def _handle_config(msgdict=None):
             log.info("handle_config")
-            # Send config data
-            emit('get_config', self.get_config())
-
-    def initialize_and_run_oven(self, oven_type, profile):
-        log.info(f"Initializing and running oven. Oven type: {oven_type}, Profile: {profile}")
+            kiln = self.get_kiln(msgdict)
+            if kiln:
+                # Send config data
+                emit('get_config', self.get_config(kiln))
+
+    def get_kiln(self, msgdict=None):
+        """
+        Return the kiln a Socket.IO request is for: the one named by its kiln field, or the one the client follows.
+        Sends an error to the client and returns None for an unknown kiln.
+        """
+        kiln_id = msgdict.get('kiln') if isinstance(msgdict, dict) else None
+        if kiln_id is None:
+            kiln_id = self.client_kilns.get(request.sid)
+        kiln = self.kilns.get(kiln_id)
+        if kiln is None:
+            emit('error', {'message': f"Unknown kiln: {kiln_id}"})
+        return kiln
+
+    def follow_kiln(self, kiln):
+        # the client gets the updates of this kiln from now on, instead of the one it followed
+        previous = self.client_kilns.get(request.sid)
+        if previous != kiln.id:
+            if previous is not None:
+                leave_room(self.kilns.get(previous).room)
+            join_room(kiln.room)
+            self.client_kilns[request.sid] = kiln.id
+
+    def get_kiln_list(self):
+        return [{'id': kiln.id, 'state': kiln.oven.state, 'temperature': kiln.oven.temperature,
+                 'profile': kiln.oven.profile.name if kiln.oven.profile else None,
+                 'is_simulation': kiln.oven.is_simulation} for kiln in self.kilns]
+
+    def broadcast_profile_changes(self, since):
+        # let every client know about the changes since the given revision
+        changes = self.prof_man.get_changes(since)
+        if changes is None:
+            self.socketio.emit('profile_list', self.prof_man.get_profiles())
+        else:
+            self.socketio.emit('profile_changes', changes)
+
+    @staticmethod
+    def parse_speed(speed):
+        # returns the simulation speed factor, None for as fast as possible or False if invalid.
+        if speed == "max":
+            return None
+        try:
+            speed = float(speed)
+        except (TypeError, ValueError):
+            return False
+        return speed if speed > 0 else False
 
+    def initialize_and_run_oven(self, kiln, oven_type, profile, speed=1):
         if not profile:
             log.error("No profile defined. Aborting.")
             abort(400, 'Expected WebSocket request.')
 
-        log.info("Cleaning up previous oven state.")
-        self.oven.die()  # Signal the thread to stop
-        self.oven.join()  # Wait for the thread to finish
-
         try:
-            log.info(f"Creating oven of type: {oven_type}")
-            self.oven = OvenFactory.create_oven(oven_type, self.config)  # Using a factory to create an oven instance
-            log.debug(f"Oven of type {oven_type} created successfully.")
+            kiln.run(oven_type, profile, speed)
         except Exception as e:
             log.error(f"Error while creating oven: {str(e)}")
             abort(400, 'Expected WebSocket request.')
 
-        log.info(f"Setting oven watcher with oven: {self.oven} and profile: {profile}")
-        self.oven_watcher.set_oven(self.oven)
-        self.oven_watcher.set_profile(profile)
-
-        log.info(f"Running oven profile: {profile}")
-        self.oven.run_profile(profile)
-
-    def get_config(self):
+    def get_bootstrap(self, kiln):
+        # the serialized snapshot of a kiln is shared by all its clients until the profiles or its backlog change.
+        profiles = self.prof_man.get_profiles()
+        key = (self.prof_man.epoch, self.prof_man.revision, kiln.watcher.version)
+        if key == kiln.bootstrap_key:
+            self.bootstrap_hits += 1
+        else:
+            self.bootstrap_misses += 1
+            kiln.bootstrap = ('{"kiln": ' + json.dumps(kiln.id) + ', "kilns": ' + json.dumps(self.kilns.ids())
+                              + ', "config": ' + json.dumps(self.get_config(kiln)) + ', "profile_list": ' + profiles
+                              + ', "backlog": ' + json.dumps(kiln.watcher.get_backlog()) + '}')
+            kiln.bootstrap_key = key
+        return kiln.bootstrap
+
+    def check_admin(self):
+        # the admin endpoints don't exist without a token, and need it in the X-Admin-Token header
+        if not self.config.admin_token:
+            abort(404)
+        token = request.headers.get('X-Admin-Token', '')
+        if not hmac.compare_digest(token.encode(), self.config.admin_token.encode()):
+            abort(403)
+
+    def create_metrics(self):
+        # everything is read from counters the components keep anyway when /metrics is scraped, through
+        # kiln.oven so the metrics follow the oven when a new run replaces it
+        registry = Registry()
+
+        def per_kiln(function):
+            return lambda: {kiln.id: function(kiln) for kiln in self.kilns}
+
+        registry.gauge('kiln_temperature', 'Kiln temperature', per_kiln(lambda kiln: kiln.oven.temperature), 'kiln')
+        registry.gauge('kiln_target_temperature', 'Target temperature of the running profile',
+                       per_kiln(lambda kiln: kiln.oven.target), 'kiln')
+        registry.gauge('kiln_heat_duty', 'Share of the time the heat is on, 0 to 1',
+                       per_kiln(lambda kiln: kiln.oven.duty), 'kiln')
+        registry.gauge('kiln_cost', 'Energy cost of the current run', per_kiln(lambda kiln: kiln.oven.cost), 'kiln')
+        registry.gauge('kiln_state', 'Oven state, 1 for the current one', label=('kiln', 'state'),
+                       function=lambda: {(kiln.id, state): int(kiln.oven.state == state)
+                                         for kiln in self.kilns for state in OVEN_STATES})
+        registry.gauge('kiln_simulation', '1 if the oven is simulated',
+                       per_kiln(lambda kiln: int(bool(kiln.oven.is_simulation))), 'kiln')
+        registry.histogram('kiln_sensor_read_seconds', 'Thermocouple read time',
+                           function=per_kiln(lambda kiln: kiln.oven.temp_sensor.read_latency), label='kiln')
+        registry.counter('kiln_sensor_reads_total', 'Thermocouple samples taken',
+                         per_kiln(lambda kiln: kiln.oven.temp_sensor.get_stats().get('taken', 0)), 'kiln')
+        registry.counter('kiln_sensor_read_errors_total', 'Thermocouple reads that failed',
+                         per_kiln(lambda kiln: kiln.oven.temp_sensor.get_stats().get('read_errors', 0)), 'kiln')
+        registry.counter('kiln_sensor_bad_reads_total', 'Thermocouple readings with a fault',
+                         per_kiln(lambda kiln: kiln.oven.temp_sensor.get_stats().get('bad_reads', 0)), 'kiln')
+        registry.counter('kiln_loop_overruns_total', 'Control loop ticks that ran past the next deadline',
+                         per_kiln(lambda kiln: kiln.oven.loop_stats.overruns), 'kiln')
+        registry.counter('kiln_loop_skipped_total', 'Control loop ticks skipped after an overrun',
+                         per_kiln(lambda kiln: kiln.oven.loop_stats.skipped), 'kiln')
+        registry.counter('kiln_emits_total', 'Socket.IO messages emitted by the oven watcher',
+                         per_kiln(lambda kiln: kiln.watcher.emits), 'kiln')
+        registry.gauge('kiln_clients', 'Connected Socket.IO clients', lambda: self.clients)
+        registry.counter('kiln_profile_summary_hits_total', 'Profile summaries found in the profile index',
+                         lambda: self.prof_man.profile_index.hits if self.prof_man.profile_index else 0)
+        registry.counter('kiln_profile_summary_misses_total', 'Profile summaries computed',
+                         lambda: self.prof_man.profile_index.misses if self.prof_man.profile_index else 0)
+        registry.counter('kiln_bootstrap_hits_total', 'Bootstrap messages served from the cached snapshot',
+                         lambda: self.bootstrap_hits)
+        registry.counter('kiln_bootstrap_misses_total', 'Bootstrap snapshots rebuilt', lambda: self.bootstrap_misses)
+        return registry
+
+    def get_config(self, kiln):
         return {"temp_scale": self.config.temp_scale,
                 "time_scale_slope": self.config.time_scale_slope,
                 "time_scale_profile": self.config.time_scale_profile,
-                'kp': self.config.pid_kp,
-                'ki': self.config.pid_ki,
-                'kd': self.config.pid_kd,
-                "kwh_rate": self.config.kwh_rate,
-                "currency_type": self.config.currency_type}
+                'kp': kiln.config.pid_kp,
+                'ki': kiln.config.pid_ki,
+                'kd': kiln.config.pid_kd,
+                "kwh_rate": kiln.config.kwh_rate,
+                "currency_type": self.config.currency_type,
+                "telemetry_fields": TELEMETRY_FIELDS}
 
     def run(self):
         ip = self.config.ip_address
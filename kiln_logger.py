@@ -1,97 +1,234 @@
 #!/usr/bin/env python
 
-import websocket
-import json
-import time
-import csv
 import argparse
+import asyncio
+import csv
+import datetime
+import gzip
+import io
+import logging
+import os
+import shutil
 import sys
+import time
+
+import socketio
+
+from lib.telemetry import FIELDS, TelemetryDecoder
+
+log = logging.getLogger("kiln_logger")
+
+HEADER = ['stamp'] + list(FIELDS)
+
+
+class Recorder:
+    """
+    Buffers the status rows of one controller and writes them to csv in batches.
 
-# Define standard and PID headers for CSV file
-STD_HEADER = [
-    'stamp',
-    'time_stamp',
-    'temperature',
-    'target',
-    'state',
-    'heat',
-    'total_time',
-    'profile',
-]
-
-PID_HEADER = [
-    'pid_time',
-    'pid_timeDelta',
-    'pid_setpoint',
-    'pid_ispoint',
-    'pid_err',
-    'pid_errDelta',
-    'pid_p',
-    'pid_i',
-    'pid_d',
-    'pid_kp',
-    'pid_ki',
-    'pid_kd',
-    'pid_pid',
-    'pid_out',
-]
-
-def logger(hostname, csv_file, profile_stats, pid_stats, stdout):
-    status_ws = websocket.WebSocket()
-
-    # Determine CSV fields based on flags
-    csv_fields = STD_HEADER if profile_stats else []
-    csv_fields += PID_HEADER if pid_stats else []
-
-    # Setup CSV writer for file output
-    with open(csv_file, 'w', newline='') as output_file:
-        csv_writer = csv.DictWriter(output_file, csv_fields, extrasaction='ignore')
-        csv_writer.writeheader()
-
-        # Setup CSV writer for standard output if required
-        csv_stdout = csv.DictWriter(sys.stdout, csv_fields, extrasaction='ignore', delimiter='\t') if stdout else None
+    Output goes to <directory>/<name>-<date>.csv. A file is rotated once it is bigger than max_bytes or older
+    than max_age seconds, and rotated files are gzipped in the background.
+    """
+
+    def __init__(self, directory, name, max_bytes=10 * 1024 * 1024, max_age=24 * 3600, stdout=False):
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.stdout = stdout
+        self.rows = []
+        self.file = None
+        self.path = None
+        self.opened = None
         if stdout:
-            csv_stdout.writeheader()
+            print('\t'.join(HEADER))
+
+    def add(self, row):
+        self.rows.append(row)
+
+    def _open(self):
+        self.path = os.path.join(self.directory,
+                                 f"{self.name}-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.csv")
+        self.file = open(self.path, 'w', newline='')
+        self.opened = time.monotonic()
+        csv.writer(self.file).writerow(HEADER)
+        log.info(f"Recording {self.name} to {self.path}")
+
+    async def _rotate(self):
+        path = self.path
+        self.file.close()
+        self.file = None
+        await asyncio.get_running_loop().run_in_executor(None, compress, path)
+
+    async def flush(self):
+        if not self.rows:
+            return
+        rows, self.rows = self.rows, []
+        if self.file and (self.file.tell() > self.max_bytes or time.monotonic() - self.opened > self.max_age):
+            await self._rotate()
+        if self.file is None:
+            self._open()
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([format_value(row.get(field)) for field in HEADER])
+        self.file.write(buffer.getvalue())
+        self.file.flush()
+        if self.stdout:
+            sys.stdout.write(buffer.getvalue().replace(',', '\t'))
+            sys.stdout.flush()
+
+    async def close(self):
+        await self.flush()
+        if self.file:
+            await self._rotate()
+
+
+def format_value(value):
+    return '{:5.3f}'.format(value) if isinstance(value, float) else value
 
-        # Main data logging loop
+
+def compress(path):
+    with open(path, 'rb') as source, gzip.open(path + '.gz', 'wb') as target:
+        shutil.copyfileobj(source, target)
+    os.remove(path)
+
+
+class ControllerLogger:
+    """
+    Records the oven_update stream of one kiln controller.
+
+    After a disconnect it reconnects with exponential backoff and fills the gap from the controller's firing
+    history, so short disconnects don't lose samples of a running firing.
+    """
+
+    def __init__(self, hostname, recorder, min_delay=1, max_delay=60, kiln=None):
+        self.hostname = hostname
+        # kiln id on a controller running several kilns, None for its default kiln
+        self.kiln = kiln
+        self.recorder = recorder
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.decoder = TelemetryDecoder()
+        self.last = None
+        # time_stamps of the last sample before a disconnect and the first one after it
+        self.gap = None
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.sio.on('connect', self.on_connect)
+        self.sio.on('get_config', self.on_config)
+        self.sio.on('oven_update', self.on_update)
+        self.sio.on('firing_list', self.on_firing_list)
+        self.sio.on('firing_data', self.on_firing_data)
+
+    async def run(self):
+        delay = self.min_delay
         while True:
             try:
-                msg = json.loads(status_ws.recv())
-            except websocket.WebSocketException:
-                try:
-                    status_ws.connect(f'ws://{hostname}/status')
-                except Exception:
-                    time.sleep(5)
-                continue
-
-            # Skip backlog messages
-            if msg.get('type') == 'backlog':
-                continue
-
-            # Process message for CSV and stdout output
-            if profile_stats:
-                msg['stamp'] = time.time()
-            if pid_stats and 'pid_stats' in msg:
-                msg.update({f"pid_{k}": v for k, v in msg['pid_stats'].items()})
-
-            formatted_msg = {k: '{:5.3f}'.format(v) if isinstance(v, float) else v for k, v in msg.items()}
-
-            # Write formatted message to CSV file and flush
-            csv_writer.writerow(formatted_msg)
-            output_file.flush()
-
-            # Write the same formatted message to stdout (if enabled) and flush
-            if stdout:
-                csv_stdout.writerow(formatted_msg)
-                sys.stdout.flush()
+                await self.sio.connect(f"http://{self.hostname}")
+                delay = self.min_delay
+                await self.sio.wait()
+                log.warning(f"Disconnected from {self.hostname}")
+            except socketio.exceptions.ConnectionError as e:
+                log.warning(f"Can't connect to {self.hostname}: {e}, retrying in {delay}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_delay)
+
+    async def on_connect(self):
+        log.info(f"Connected to {self.hostname}")
+        if self.kiln is None:
+            await self.sio.emit('request_config')
+        else:
+            # follow the kiln, the controller answers with its config
+            await self.sio.emit('select_kiln', {'kiln': self.kiln})
+        if self.last and self.last.get('state') in ("RUNNING", "COMPLETE"):
+            # we were recording a firing, fetch what was missed
+            self.gap = [self.last['time_stamp'], None]
+            await self.sio.emit('request_firings', {'profile': self.last.get('profile'), 'limit': 1})
+
+    async def on_config(self, config):
+        self.decoder = TelemetryDecoder(config.get('telemetry_fields', FIELDS))
+
+    async def on_update(self, payload):
+        status = self.decoder.decode(payload)
+        if status is None:
+            await self.sio.emit('request_keyframe')
+            return
+        self.record(status)
+
+    def record(self, status):
+        if (self.last and status['state'] == "RUNNING" == self.last['state']
+                and status['time_stamp'] <= self.last['time_stamp']):
+            # already recovered from the firing history
+            return
+        if self.gap and self.gap[1] is None:
+            self.gap[1] = status['time_stamp']
+        status['stamp'] = time.time()
+        self.recorder.add(status)
+        self.last = status
+
+    async def on_firing_list(self, runs):
+        if runs and runs[0]['ended'] is None and self.gap:
+            await self.sio.emit('request_firing', {'id': runs[0]['id'], 'start': self.gap[0], 'end': self.gap[1],
+                                                   'max_points': None})
+
+    async def on_firing_data(self, run):
+        if not self.gap:
+            return
+        start, end = self.gap
+        self.gap = None
+        # recovered samples are written after the ones received since the reconnect, the stamp column is when
+        # they were recovered.
+        missed = [sample for sample in run['log']
+                  if sample['time_stamp'] > start and (end is None or sample['time_stamp'] < end)]
+        if missed:
+            log.info(f"Recovered {len(missed)} samples of {self.hostname} missed while disconnected")
+        for sample in missed:
+            sample['stamp'] = time.time()
+            self.recorder.add(dict(self.last, **sample))
+        if missed and end is None:
+            self.last = dict(self.last, **missed[-1])
+
+
+async def flush_periodically(recorders, interval):
+    while True:
+        await asyncio.sleep(interval)
+        for recorder in recorders:
+            await recorder.flush()
+
+
+async def main(args):
+    loggers = []
+    for address in args.hostname:
+        hostname, _, kiln = address.partition('/')
+        name = address.replace(':', '_').replace('/', '_')
+        recorder = Recorder(args.directory, name, args.rotate_mb * 1024 * 1024, args.rotate_hours * 3600,
+                            args.stdout)
+        loggers.append(ControllerLogger(hostname, recorder, kiln=kiln or None))
+
+    recorders = [logger.recorder for logger in loggers]
+    try:
+        await asyncio.gather(flush_periodically(recorders, args.flush_interval), *[logger.run() for logger in loggers])
+    finally:
+        for logger in loggers:
+            await logger.sio.disconnect()
+        for recorder in recorders:
+            await recorder.close()
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Log kiln data for analysis.')
-    parser.add_argument('--hostname', type=str, default="localhost:8081", help="The kiln-controller hostname:port")
-    parser.add_argument('--csv_file', type=str, default="/tmp/kiln_stats.csv", help="Where to write the kiln stats to")
-    parser.add_argument('--pid_stats', action='store_false', help="Include PID stats")
-    parser.add_argument('--profile_stats', action='store_false', help="store profile stats (default is to store them)")
-    parser.add_argument('--stdout', action='store_false', help="Also print to stdout")
+    parser.add_argument('--hostname', type=str, nargs='+', default=["localhost:8081"],
+                        help="The kiln-controller hostname:port, or hostname:port/kiln for one kiln of a controller "
+                             "running several, several to record more than one kiln")
+    parser.add_argument('--directory', type=str, default="/tmp", help="Where to write the kiln stats to")
+    parser.add_argument('--flush_interval', type=float, default=10, help="Seconds between writes")
+    parser.add_argument('--rotate_mb', type=float, default=10, help="Start a new file when this big")
+    parser.add_argument('--rotate_hours', type=float, default=24, help="Start a new file when this old")
+    parser.add_argument('--stdout', action='store_true', help="Also print to stdout")
     args = parser.parse_args()
 
-    logger(args.hostname, args.csv_file, args.profile_stats, args.pid_stats, args.stdout)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
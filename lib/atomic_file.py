@@ -0,0 +1,31 @@
+import os
+import stat
+import tempfile
+
+
+def _file_mode(path):
+    """The mode of the file at path, or the mode a new file gets under the current umask."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def write_atomic(path, text):
+    """
+    Write text to a hidden temp file next to path and rename it over path, so a crash never leaves a truncated
+    file behind. The temp file is created 0600, it gets the mode of the file it replaces first.
+    """
+    with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(path) or '.', prefix='.', suffix='.tmp',
+                                     delete=False) as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        os.chmod(f.name, _file_mode(path))
+        os.replace(f.name, path)
+    except OSError:
+        os.remove(f.name)
+        raise
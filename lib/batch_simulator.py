@@ -0,0 +1,213 @@
+import logging
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# Config parameters that may differ between the ovens of a batch and the attribute holding them.
+# Names and attributes mirror SimulatedOven and PID so results are comparable with a single simulation.
+BATCH_PARAMETERS = {
+    'simulated_room_temp': 'environ_temp',
+    'element_heat_capacity': 'elem_heat_capacity',
+    'oven_heat_capacity': 'c_oven',
+    'oven_heating_power': 'p_heat',
+    'thermal_res_oven_to_environ': 'oven_resistance',
+    'thermal_res_element_to_oven': 'element_resistance',
+    'pid_kp': 'kp',
+    'pid_ki': 'ki',
+    'pid_kd': 'kd',
+}
+
+RUNNING = 0
+COMPLETE = 1
+ABORTED = 2
+STATES = ("RUNNING", "COMPLETE", "ABORTED")
+
+
+class BatchSimulator:
+    """
+    Runs many simulated ovens through a profile at once.
+
+    Every oven has its own thermal and PID parameters. The state of all ovens is held in numpy
+    arrays and advanced with one vectorized step per tick, following the same tick as Oven._run
+    for a SimulatedOven: simulate, catch up, update runtime and target, PID, safety checks.
+    Any of the BATCH_PARAMETERS can be passed as a scalar or an array of length size,
+    everything else comes from the configuration.
+    """
+
+    def __init__(self, configuration, size, **parameters):
+        unknown = set(parameters) - set(BATCH_PARAMETERS)
+        if unknown:
+            raise ValueError(f"Unknown batch parameters: {', '.join(sorted(unknown))}")
+
+        self.config = configuration
+        self.size = size
+        self.time_step = self.config.sensor_time_wait
+
+        for name, attribute in BATCH_PARAMETERS.items():
+            value = parameters.get(name, getattr(self.config, name))
+            setattr(self, attribute, np.broadcast_to(np.asarray(value, dtype=float), (size,)).copy())
+
+        self.reset()
+
+    def reset(self):
+        """Put every oven back at room temperature with a fresh PID and no accumulated results."""
+        size = self.size
+        self.temperature = self.environ_temp.copy()
+        self.element_temperature = self.environ_temp.copy()
+        self.heat_energy = np.zeros(size)
+        self.heat = np.zeros(size)
+        self.target = np.zeros(size)
+        self.time_stamp = np.zeros(size)
+        self.state = np.full(size, RUNNING, dtype=np.int8)
+        self.elapsed = 0.0
+
+        # PID state, initialized like PID.reset()
+        self.integral = np.zeros(size)
+        self.last_input = np.zeros(size)
+        self.last_error = np.zeros(size)
+
+        # safety check state, see Oven.check_temperature_increase()
+        self.previous_temperature = np.full(size, np.nan)
+        self.stable_temp_start_time = np.full(size, np.nan)
+
+        # accumulated results
+        self.ticks = np.zeros(size, dtype=np.int64)
+        self.heat_seconds = np.zeros(size)
+        self.abs_error = np.zeros(size)
+        self.squared_error = np.zeros(size)
+        self.max_overshoot = np.full(size, -np.inf)
+        self.switches = np.zeros(size, dtype=np.int64)
+        self._last_duty = np.zeros(size)
+
+    def run(self, profile, max_time=None, record_every=None):
+        """
+        Simulate all ovens through profile until each one completed or aborted, or max_time
+        simulated seconds (default twice the profile duration) have passed.
+
+        If record_every is set, the temperature of every oven is recorded every that many ticks.
+        """
+        self.reset()
+        total_time = profile.get_duration()
+        max_time = 2 * total_time if max_time is None else max_time
+        log.info(f"Simulating {self.size} ovens through {profile.name}")
+
+        trace_times, trace_temperatures = [], []
+        tick = 0
+        while self.elapsed <= max_time and (self.state == RUNNING).any():
+            if record_every and tick % record_every == 0:
+                trace_times.append(self.elapsed)
+                trace_temperatures.append(self.temperature.copy())
+            self.step(profile, total_time, first=tick == 0)
+            tick += 1
+
+        results = self.results()
+        if record_every:
+            results['trace_time'] = np.array(trace_times)
+            results['trace_temperature'] = np.array(trace_temperatures)
+        log.info(f"Simulated {tick} ticks, {np.count_nonzero(self.state == COMPLETE)} of {self.size} ovens completed")
+        return results
+
+    def step(self, profile, total_time, first=False):
+        """Advance every oven by one time_step."""
+        running = self.state == RUNNING
+
+        self.simulate_temp_changes()
+
+        # kiln_must_catch_up() and update_runtime(): runtime only advances while close enough to target
+        if not first:
+            advance = running
+            if self.config.kiln_must_catch_up:
+                advance = advance & ((self.target - self.temperature) <= self.config.profile_pause_window)
+            self.time_stamp += np.where(advance, self.time_step, 0.0)
+
+        self.target = np.where(running, profile.get_target_temperatures(self.time_stamp), 0.0)
+
+        pid_output = np.where(running, self.compute_pid(), 0.0)
+        self.apply_heat(pid_output)
+        self.accumulate(running & (self.time_stamp <= total_time), pid_output)
+
+        self.check_temperature_increase(running)
+        self.state[running & (self.temperature >= self.config.emergency_shutoff_temp)] = ABORTED
+        self.state[(self.state == RUNNING) & (self.time_stamp > total_time)] = COMPLETE
+
+        self.elapsed += self.time_step
+
+    def compute_pid(self):
+        """Vectorized PID.compute() with elapsed_time of one time_step."""
+        error = self.target - self.temperature
+        d_input = self.temperature - self.last_input
+        d_error = error - self.last_error
+
+        proportional = self.kp * error
+        self.integral = np.clip(self.integral + self.ki * error * self.time_step, *self.config.integral_limits)
+        if self.config.derivative_on_measurement:
+            derivative = -self.kd * d_input / self.time_step
+        else:
+            derivative = self.kd * d_error / self.time_step
+
+        output = np.clip(proportional + self.integral + derivative, *self.config.output_limits)
+
+        self.last_input = self.temperature.copy()
+        self.last_error = error
+        return output / 100
+
+    def apply_heat(self, pid_output):
+        self.heat = np.maximum(0.0, self.time_step * pid_output)
+        self.heat_energy = self.p_heat * self.heat
+
+    def simulate_temp_changes(self):
+        """Vectorized SimulatedOven.simulate_temp_changes()."""
+        dt = self.time_step
+        self.element_temperature += self.heat_energy / self.elem_heat_capacity
+        element_to_oven = (self.element_temperature - self.temperature) / self.element_resistance
+        oven_temp = self.temperature + element_to_oven * dt / self.c_oven
+        self.element_temperature -= element_to_oven * dt / self.elem_heat_capacity
+        oven_temp -= (oven_temp - self.environ_temp) / self.oven_resistance * dt / self.c_oven
+        self.temperature = oven_temp
+
+    def check_temperature_increase(self, running):
+        """Vectorized Oven.check_temperature_increase()."""
+        below_target = running & (self.heat > 0) & (
+                self.temperature < self.target - self.config.abort_temp_diff_threshold)
+        not_increasing = below_target & (
+                self.temperature <= self.previous_temperature + self.config.temp_increase_threshold)
+
+        started = np.isnan(self.stable_temp_start_time)
+        stalled = not_increasing & ~started & (
+                self.elapsed - self.stable_temp_start_time >= self.config.abort_threshold_minutes * 60)
+        self.state[stalled] = ABORTED
+
+        self.stable_temp_start_time = np.where(
+                not_increasing, np.where(started, self.elapsed, self.stable_temp_start_time), np.nan)
+        self.previous_temperature = self.temperature.copy()
+
+    def accumulate(self, tracking, pid_output):
+        # tracking masks the ovens that are following the profile this tick
+        error = np.where(tracking, self.target - self.temperature, 0.0)
+        self.ticks += tracking
+        self.heat_seconds += self.heat
+        self.abs_error += np.abs(error)
+        self.squared_error += error * error
+        self.max_overshoot = np.where(tracking, np.maximum(self.max_overshoot, -error), self.max_overshoot)
+        # the relay closes whenever a tick has heat and the previous tick didn't end with it on
+        self.switches += (pid_output > 0) & (self._last_duty < 1)
+        self._last_duty = pid_output
+
+    def results(self):
+        """Return the accumulated results as a dict of arrays, one value per oven."""
+        ticks = np.maximum(self.ticks, 1)
+        kwh = self.heat_seconds * self.config.kw_elements / 3600
+        return {
+            'state': np.array(STATES)[self.state],
+            'time_stamp': self.time_stamp.copy(),
+            'temperature': self.temperature.copy(),
+            'ticks': self.ticks.copy(),
+            'heat_seconds': self.heat_seconds.copy(),
+            'kwh': kwh,
+            'cost': kwh * self.config.kwh_rate,
+            'mean_abs_error': self.abs_error / ticks,
+            'rms_error': np.sqrt(self.squared_error / ticks),
+            'max_overshoot': self.max_overshoot.copy(),
+            'switches': self.switches.copy(),
+        }
@@ -0,0 +1,58 @@
+import json
+import logging
+import os
+import time
+
+from lib.atomic_file import write_atomic
+
+log = logging.getLogger(__name__)
+
+
+class RunCheckpoint:
+    """
+    A small snapshot of the running firing on disk, written at most every interval seconds,
+    so the firing can be resumed after the controller restarts.
+
+    Writes go to a temp file that is renamed over the checkpoint, so a power cut leaves either
+    the previous checkpoint or the new one, never a truncated file.
+    """
+
+    def __init__(self, path, interval=10):
+        self.path = path
+        self.interval = interval
+        self._last_save = None
+        # True once this process wrote a checkpoint that has not been cleared yet
+        self.saved = False
+
+    def save(self, state, force=False):
+        now = time.monotonic()
+        if not force and self._last_save is not None and now - self._last_save < self.interval:
+            return
+        self._last_save = now
+        state = dict(state, saved_at=time.time())
+        try:
+            write_atomic(self.path, json.dumps(state))
+            self.saved = True
+        except Exception as e:
+            log.error(f"Error saving checkpoint {self.path}: {e}")
+
+    def load(self):
+        """Return the last checkpoint, or None if there is none."""
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.error(f"Error loading checkpoint {self.path}, ignoring it: {e}")
+            return None
+
+    def clear(self):
+        self._last_save = None
+        self.saved = False
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.error(f"Error removing checkpoint {self.path}: {e}")
@@ -0,0 +1,51 @@
+import datetime
+import time
+
+from gevent import sleep
+
+
+class Clock:
+    """Wall clock used by real ovens. Time passes at the speed of the real world."""
+
+    speed = 1
+
+    def now(self):
+        return datetime.datetime.now()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        sleep(seconds)
+
+    def sleep_until(self, deadline):
+        """Sleep until monotonic() reaches deadline, return right away if it already has."""
+        self.sleep(max(0.0, deadline - self.monotonic()))
+
+
+class VirtualClock(Clock):
+    """
+    Clock for simulated ovens. Time only advances when the oven sleeps on it, so every
+    tick is exactly time_step long no matter how fast the simulation runs.
+
+    speed is the factor by which the simulation runs faster than real time (1, 60, ...).
+    A speed of None runs as fast as possible, only yielding to the gevent hub between ticks.
+    """
+
+    def __init__(self, speed=1):
+        self.speed = speed
+        self._start = datetime.datetime.now()
+        self._elapsed = 0.0
+
+    def now(self):
+        return self._start + datetime.timedelta(seconds=self._elapsed)
+
+    def monotonic(self):
+        return self._elapsed
+
+    def sleep(self, seconds):
+        self._elapsed += seconds
+        sleep(seconds / self.speed if self.speed else 0)
+
+    def set_speed(self, speed):
+        self.speed = speed
@@ -0,0 +1,149 @@
+import datetime
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+from gevent import get_hub, monkey
+
+log = logging.getLogger(__name__)
+
+
+def _file_name(prefix, extension):
+    return f"{prefix}-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.{extension}"
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads of the running process every interval seconds for a fixed window and writes
+    them in the folded format of flamegraph.pl and speedscope, one line per stack with the number of samples.
+
+    The sampler runs on a thread of the hub's pool and only reads frames, so the greenlets, including the one
+    running the oven, keep running normally. Greenlets run on the main thread, its stack is the one of the
+    greenlet running at the time of the sample, the hub's when they are all waiting.
+    """
+
+    def __init__(self, directory, max_seconds=300):
+        self.directory = directory
+        self.max_seconds = max_seconds
+        self.main_ident = monkey.get_original('_thread', 'get_ident')()
+        self.running = False
+        self.file_name = None
+        self.started = None
+        self.seconds = 0
+        self.samples = 0
+        self._stop = False
+
+    def start(self, seconds=30, interval=0.01):
+        """Start sampling for seconds, return the name of the file the profile will be written to."""
+        if self.running:
+            raise ValueError(f"A profile is already running, it will be written to {self.file_name}")
+        self.seconds = min(float(seconds), self.max_seconds)
+        self.file_name = _file_name('cpu', 'folded')
+        self.started = time.monotonic()
+        self.samples = 0
+        self.running = True
+        self._stop = False
+        get_hub().threadpool.spawn(self._sample, max(0.001, float(interval)))
+        log.warning(f"CPU profile started for {self.seconds:.0f}s, writing {self.file_name}")
+        return self.file_name
+
+    def stop(self):
+        """Stop sampling early, the profile taken so far is written."""
+        self._stop = True
+
+    def get_status(self):
+        return {'running': self.running, 'file': self.file_name, 'seconds': self.seconds, 'samples': self.samples,
+                'elapsed': time.monotonic() - self.started if self.running else None}
+
+    def _sample(self, interval):
+        # runs on a pool thread, sleep with the real time.sleep even if the time module is monkey patched
+        real_sleep = monkey.get_original('time', 'sleep')
+        own_ident = monkey.get_original('_thread', 'get_ident')()
+        labels = {}
+        stacks = {}
+        deadline = time.monotonic() + self.seconds
+        try:
+            while not self._stop and time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_ident:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        label = labels.get(code)
+                        if label is None:
+                            label = labels[code] = (f"{code.co_name} ({os.path.basename(code.co_filename)}:"
+                                                    f"{code.co_firstlineno})")
+                        stack.append(label)
+                        frame = frame.f_back
+                    stack.append('main' if ident == self.main_ident else 'thread')
+                    key = ';'.join(reversed(stack))
+                    stacks[key] = stacks.get(key, 0) + 1
+                self.samples += 1
+                real_sleep(interval)
+
+            with open(os.path.join(self.directory, self.file_name), 'w') as f:
+                for stack, count in sorted(stacks.items()):
+                    f.write(f"{stack} {count}\n")
+            log.warning(f"CPU profile written to {self.file_name}, {self.samples} samples")
+        except Exception as e:
+            log.error(f"Error taking CPU profile: {e}")
+        finally:
+            self.running = False
+
+
+class MemorySnapshots:
+    """
+    tracemalloc snapshots of the running process. The first snapshot starts tracing and lists the largest
+    allocations since, every later one the difference to the previous snapshot. Tracing slows allocations down
+    and costs memory, stop it when done.
+    """
+
+    def __init__(self, directory, frames=10, top=50):
+        self.directory = directory
+        self.frames = frames
+        self.top = top
+        self.previous = None
+
+    def snapshot(self):
+        """Take a snapshot and write the report, return its file name."""
+        # take and compare on a pool thread, a large snapshot takes a while and the hub keeps running meanwhile
+        return get_hub().threadpool.apply(self._snapshot)
+
+    def stop(self):
+        tracemalloc.stop()
+        self.previous = None
+
+    def get_status(self):
+        current, peak = tracemalloc.get_traced_memory()
+        return {'tracing': tracemalloc.is_tracing(), 'current': current, 'peak': peak}
+
+    def _snapshot(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.previous = None
+            log.warning("Memory tracing started")
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        if self.previous is None:
+            title = "Largest allocations since tracing started"
+            stats = snapshot.statistics('lineno')
+        else:
+            title = "Largest changes since the previous snapshot"
+            stats = snapshot.compare_to(self.previous, 'lineno')
+        self.previous = snapshot
+
+        file_name = _file_name('memory', 'txt')
+        current, peak = tracemalloc.get_traced_memory()
+        with open(os.path.join(self.directory, file_name), 'w') as f:
+            f.write(f"Traced memory: {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB\n")
+            f.write(f"{title}:\n")
+            for stat in stats[:self.top]:
+                f.write(f"{stat}\n")
+        log.warning(f"Memory snapshot written to {file_name}")
+        return file_name
@@ -0,0 +1,203 @@
+import logging
+import sqlite3
+import time
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    profile TEXT,
+    is_simulation INTEGER NOT NULL,
+    started REAL NOT NULL,
+    ended REAL,
+    state TEXT NOT NULL,
+    total_time REAL,
+    duration REAL NOT NULL DEFAULT 0,
+    samples INTEGER NOT NULL DEFAULT 0,
+    peak_temperature REAL,
+    cost REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+CREATE INDEX IF NOT EXISTS runs_profile ON runs (profile, started);
+CREATE TABLE IF NOT EXISTS samples (
+    run_id INTEGER NOT NULL,
+    time_stamp REAL NOT NULL,
+    temperature REAL,
+    target REAL,
+    heat REAL,
+    cost REAL,
+    PRIMARY KEY (run_id, time_stamp)
+) WITHOUT ROWID;
+"""
+
+SAMPLE_FIELDS = ('time_stamp', 'temperature', 'target', 'heat', 'cost')
+RUN_FIELDS = ('id', 'profile', 'is_simulation', 'started', 'ended', 'state', 'total_time', 'duration', 'samples',
+              'peak_temperature', 'cost')
+
+
+class FiringStore:
+    """
+    Every firing, with all of its samples, in a SQLite database.
+
+    The database runs in WAL mode so writing samples is a small sequential write that readers don't block.
+    Samples are buffered and written in one transaction every commit_interval seconds or max_pending samples,
+    whichever comes first, and whenever the store is read or a run ends.
+    Samples are clustered by (run_id, time_stamp), so a part of one run is read without touching the others,
+    and runs are indexed by start time and profile. Runs keep a running summary (duration, peak temperature,
+    cost) so they can be listed without reading their samples.
+    """
+
+    def __init__(self, path, commit_interval=5, max_pending=1000):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.max_pending = max_pending
+        # run_id -> sample rows not written yet
+        self._pending = {}
+        self._pending_count = 0
+        self._last_flush = time.monotonic()
+        # only used from the gevent hub thread, greenlets take turns
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # with WAL a power cut can lose the last commits but never corrupts the database
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self._states = {}
+        self.close_interrupted()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def close_interrupted(self):
+        """Mark runs left open by a crash or power cut as INTERRUPTED."""
+        with self.db:
+            cursor = self.db.execute("UPDATE runs SET state = 'INTERRUPTED', ended = started + duration "
+                                     "WHERE ended IS NULL")
+        if cursor.rowcount:
+            log.warning(f"Marked {cursor.rowcount} unfinished firing(s) as interrupted")
+
+    def start_run(self, status):
+        """Open a run for the given oven status and return its id."""
+        with self.db:
+            cursor = self.db.execute(
+                    "INSERT INTO runs (profile, is_simulation, started, state, total_time) VALUES (?, ?, ?, ?, ?)",
+                    (status.get('profile'), bool(status.get('is_simulation')), time.time(), status.get('state'),
+                     status.get('total_time')))
+        run_id = cursor.lastrowid
+        self._states[run_id] = status.get('state')
+        log.info(f"Recording firing {run_id} of profile {status.get('profile')}")
+        return run_id
+
+    def resume_run(self, run_id):
+        """Reopen an interrupted run, return False if there is no such run."""
+        with self.db:
+            cursor = self.db.execute("UPDATE runs SET ended = NULL, state = 'RUNNING' WHERE id = ?", (run_id,))
+        if not cursor.rowcount:
+            return False
+        self._states[run_id] = "RUNNING"
+        log.info(f"Resumed recording firing {run_id}")
+        return True
+
+    def append(self, run_id, status):
+        self._pending.setdefault(run_id, []).append([status.get(field) or 0 for field in SAMPLE_FIELDS])
+        self._pending_count += 1
+        state = status.get('state')
+        if state != self._states.get(run_id):
+            self.flush()
+            with self.db:
+                self.db.execute("UPDATE runs SET state = ? WHERE id = ?", (state, run_id))
+            self._states[run_id] = state
+        elif (self._pending_count >= self.max_pending
+                or time.monotonic() - self._last_flush >= self.commit_interval):
+            self.flush()
+
+    def flush(self):
+        """Write the buffered samples and update the summaries of their runs."""
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        pending, self._pending, self._pending_count = self._pending, {}, 0
+        count = "SELECT count(*) FROM samples WHERE run_id = ? AND time_stamp BETWEEN ? AND ?"
+        with self.db:
+            for run_id, rows in pending.items():
+                time_stamps = [row[0] for row in rows]
+                span = (run_id, min(time_stamps), max(time_stamps))
+                # a resumed run writes some time_stamps again, they replace the old samples and don't add up
+                before = self.db.execute(count, span).fetchone()[0]
+                self.db.executemany("INSERT OR REPLACE INTO samples (run_id, time_stamp, temperature, target, heat, "
+                                    "cost) VALUES (?, ?, ?, ?, ?, ?)", [[run_id] + row for row in rows])
+                added = self.db.execute(count, span).fetchone()[0] - before
+                peak = max(row[1] for row in rows)
+                self.db.execute("UPDATE runs SET duration = max(duration, ?), samples = samples + ?, "
+                                "peak_temperature = max(coalesce(peak_temperature, ?), ?), cost = ? WHERE id = ?",
+                                (span[2], added, peak, peak, rows[-1][4], run_id))
+
+    def end_run(self, run_id, state):
+        """Close a run. A run that ends while still RUNNING was stopped by hand."""
+        self.flush()
+        last_state = self._states.pop(run_id, None)
+        if state == "IDLE":
+            state = "STOPPED" if last_state == "RUNNING" else last_state
+        with self.db:
+            self.db.execute("UPDATE runs SET ended = ?, state = ? WHERE id = ?", (time.time(), state, run_id))
+        log.info(f"Firing {run_id} ended: {state}")
+
+    def get_run(self, run_id):
+        self.flush()
+        row = self.db.execute(f"SELECT {', '.join(RUN_FIELDS)} FROM runs WHERE id = ?", (run_id,)).fetchone()
+        return self._run_dict(row) if row else None
+
+    def list_runs(self, profile=None, since=None, until=None, limit=100):
+        """Return the most recent runs first, optionally only those of a profile or started in [since, until]."""
+        self.flush()
+        conditions, parameters = [], []
+        if profile is not None:
+            conditions.append("profile = ?")
+            parameters.append(profile)
+        if since is not None:
+            conditions.append("started >= ?")
+            parameters.append(since)
+        if until is not None:
+            conditions.append("started <= ?")
+            parameters.append(until)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        rows = self.db.execute(f"SELECT {', '.join(RUN_FIELDS)} FROM runs {where}ORDER BY started DESC LIMIT ?",
+                               parameters + [limit])
+        return [self._run_dict(row) for row in rows]
+
+    def get_samples(self, run_id, start=None, end=None, max_points=None):
+        """
+        Return the samples of a run between time_stamps start and end. With max_points, the range is split in
+        max_points / 2 buckets and the coolest and hottest sample of every bucket are returned, in time order.
+        """
+        self.flush()
+        start = 0 if start is None else start
+        end = float('inf') if end is None else end
+        columns = ', '.join(SAMPLE_FIELDS)
+        if max_points:
+            first, last, count = self.db.execute(
+                    "SELECT min(time_stamp), max(time_stamp), count(*) FROM samples "
+                    "WHERE run_id = ? AND time_stamp BETWEEN ? AND ?", (run_id, start, end)).fetchone()
+            if count > max_points:
+                buckets = max(max_points // 2, 1)
+                width = (last - first) / buckets
+                rows = {}
+                for extreme in ('min', 'max'):
+                    # sqlite returns the other columns from the row with the min() or max() value
+                    for row in self.db.execute(
+                            f"SELECT time_stamp, {extreme}(temperature), target, heat, cost FROM samples "
+                            f"WHERE run_id = ? AND time_stamp BETWEEN ? AND ? "
+                            f"GROUP BY min(CAST((time_stamp - ?) / ? AS INTEGER), ?)",
+                            (run_id, start, end, first, width, buckets - 1)):
+                        rows[row[0]] = row
+                return [dict(zip(SAMPLE_FIELDS, rows[time_stamp])) for time_stamp in sorted(rows)]
+        rows = self.db.execute(f"SELECT {columns} FROM samples WHERE run_id = ? AND time_stamp BETWEEN ? AND ? "
+                               f"ORDER BY time_stamp", (run_id, start, end))
+        return [dict(zip(SAMPLE_FIELDS, row)) for row in rows]
+
+    @staticmethod
+    def _run_dict(row):
+        run = dict(zip(RUN_FIELDS, row))
+        run['is_simulation'] = bool(run['is_simulation'])
+        return run
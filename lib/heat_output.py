@@ -23,6 +23,11 @@ class HeatOutput:
             log.warning(f"Could not initialize GPIOs, oven operation will only be simulated: {e}")
             self.active = False
 
+    def set(self, on):
+        """Switch the heat on or off and return right away."""
+        if self.active:
+            self.GPIO.output(self.config.gpio_heat, self.GPIO.HIGH if on else self.GPIO.LOW)
+
     def heat(self, sleep_for):
         self.GPIO.output(self.config.gpio_heat, self.GPIO.HIGH)
         sleep(sleep_for)
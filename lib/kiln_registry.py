@@ -0,0 +1,161 @@
+import logging
+import os
+import time
+
+import gevent
+
+from lib.checkpoint import RunCheckpoint
+from lib.firing_store import FiringStore
+from lib.oven_factory import OvenFactory
+from lib.oven_watcher import OvenWatcher
+from lib.profile import Profile
+
+log = logging.getLogger(__name__)
+
+# settings naming a file of one kiln, with several kilns every kiln gets its own
+KILN_FILES = ('firing_history_file', 'checkpoint_file')
+
+
+class KilnConfig:
+    """The settings of one kiln: the ones from its entry in the kilns setting, everything else from the config."""
+
+    def __init__(self, configuration, kiln_id, settings):
+        self._configuration = configuration
+        self.kiln_id = kiln_id
+        self.__dict__.update(settings)
+
+    def __getattr__(self, name):
+        return getattr(self._configuration, name)
+
+
+class Kiln:
+    """
+    One kiln: its oven, the watcher that sends its updates, and its firing history and checkpoint.
+
+    Clients following a kiln are in its Socket.IO room, its updates are only sent there. Every kiln has its own
+    oven greenlet, sensor thread and SSR scheduler, a kiln never waits for another one.
+    """
+
+    def __init__(self, kiln_id, configuration, socketio=None):
+        self.id = kiln_id
+        self.config = configuration
+        self.room = f"kiln:{kiln_id}"
+        # Initialize with the simulated oven
+        self.oven = OvenFactory.create_oven(OvenFactory.SIMULATED, self.config)
+        self.firing_store = FiringStore(self.config.firing_history_file) if self.config.firing_history_file else None
+        self.checkpoint = RunCheckpoint(self.config.checkpoint_file,
+                                        self.config.checkpoint_interval) if self.config.checkpoint_file else None
+        self.watcher = OvenWatcher(self.oven, self.config, socketio, firing_store=self.firing_store,
+                                   checkpoint=self.checkpoint, room=self.room)
+        # serialized bootstrap snapshot and the versions it was built from
+        self.bootstrap = None
+        self.bootstrap_key = None
+
+    def start(self):
+        self.watcher.start()
+        self.resume_interrupted_run()
+
+    def replace_oven(self, oven_type, speed=1):
+        self.stop_oven()
+        log.info(f"[{self.id}] Creating oven of type: {oven_type}")
+        self.set_oven(OvenFactory.create_oven(oven_type, self.config, speed))
+
+    def stop_oven(self):
+        log.info(f"[{self.id}] Cleaning up previous oven state.")
+        self.oven.die()  # Signal the thread to stop
+        self.oven.join()  # Wait for the thread to finish
+
+    def set_oven(self, oven):
+        self.oven = oven
+        self.watcher.set_oven(oven)
+
+    def run(self, oven_type, profile, speed=1):
+        log.info(f"[{self.id}] Initializing and running oven. Oven type: {oven_type}, Profile: {profile}, "
+                 f"Speed: {speed or 'max'}")
+        self.replace_oven(oven_type, speed)
+        self.watcher.set_profile(profile)
+        log.info(f"[{self.id}] Running oven profile: {profile}")
+        self.oven.run_profile(profile)
+
+    def resume_interrupted_run(self):
+        """
+        Resume a firing that was running when the controller went down, if it was down for less than
+        resume_max_downtime and the kiln cooled less than resume_temperature_band since the last checkpoint.
+        """
+        checkpoint = self.checkpoint.load() if self.checkpoint else None
+        if checkpoint is None:
+            return False
+
+        # without a real time clock the Pi may boot with a clock behind the checkpoint, the temperature check still applies.
+        downtime = max(0.0, time.time() - checkpoint['saved_at'])
+        log.warning(f"[{self.id}] Found an interrupted firing of {checkpoint['profile']['name']} at "
+                    f"{checkpoint['time_stamp']:.0f}s, down for {downtime:.0f}s")
+        if downtime > self.config.resume_max_downtime:
+            log.warning(f"[{self.id}] Controller was down too long, not resuming")
+            self.checkpoint.clear()
+            return False
+
+        try:
+            # the simulated oven is only stopped once there is a real one to replace it
+            oven = OvenFactory.create_oven(OvenFactory.REAL, self.config)
+            self.stop_oven()
+            self.set_oven(oven)
+            # give the sensor time for a few readings
+            gevent.sleep(2 * self.config.sensor_time_wait)
+            self.oven.update_temperature()
+        except Exception as e:
+            log.error(f"[{self.id}] Error while creating oven to resume, not resuming: {e}")
+            self.checkpoint.clear()
+            return False
+
+        temperature = self.oven.temperature
+        if (checkpoint['temperature'] - temperature > self.config.resume_temperature_band
+                or temperature >= self.config.emergency_shutoff_temp):
+            log.warning(f"[{self.id}] Kiln is at {temperature:.1f}, was {checkpoint['temperature']:.1f}, "
+                        f"not resuming")
+            self.checkpoint.clear()
+            return False
+
+        profile = Profile(checkpoint['profile'])
+        self.watcher.set_profile(profile)
+        self.watcher.resume_run(checkpoint.get('run_id'))
+        self.oven.resume(profile, checkpoint)
+        log.warning(f"[{self.id}] Resumed {profile.name} at {checkpoint['time_stamp']:.0f}s, kiln at {temperature:.1f}")
+        return True
+
+
+class KilnRegistry:
+    """The kilns of the kilns setting by id, the first one is the default for requests that don't name one."""
+
+    def __init__(self, configuration, socketio=None):
+        kilns = configuration.kilns
+        if not kilns:
+            raise ValueError("kilns must name at least one kiln")
+        self.kilns = {}
+        for kiln_id, settings in kilns.items():
+            settings = dict(settings)
+            if len(kilns) > 1:
+                for name in KILN_FILES:
+                    path = getattr(configuration, name)
+                    if name not in settings and path:
+                        base, extension = os.path.splitext(path)
+                        settings[name] = f"{base}-{kiln_id}{extension}"
+            self.kilns[kiln_id] = Kiln(kiln_id, KilnConfig(configuration, kiln_id, settings), socketio)
+        self.default_id = next(iter(self.kilns))
+
+    def __iter__(self):
+        return iter(self.kilns.values())
+
+    def __len__(self):
+        return len(self.kilns)
+
+    def ids(self):
+        return list(self.kilns)
+
+    def get(self, kiln_id=None):
+        """Return the kiln with kiln_id, the default one if kiln_id is None, or None if there is no such kiln."""
+        return self.kilns.get(self.default_id if kiln_id is None else kiln_id)
+
+    def start(self):
+        # side by side, so the kilns resuming a firing wait for their sensors at the same time
+        gevent.joinall([gevent.spawn(kiln.start) for kiln in self], raise_error=True)
@@ -0,0 +1,92 @@
+from array import array
+
+
+class RollingStats:
+    """
+    The last capacity values of a measurement, with percentiles computed only when asked for.
+
+    Recording is a store into a preallocated array, so it can be done every stage of every tick.
+    """
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.values = array('d', bytes(8 * capacity))
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, value):
+        self.values[self.count % self.capacity] = value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def summary(self):
+        recent = sorted(self.values[:min(self.count, self.capacity)])
+        if not recent:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'p50': recent[len(recent) // 2],
+            'p99': recent[min(len(recent) - 1, int(len(recent) * 0.99))],
+            # max of the recent values and since the start
+            'recent_max': recent[-1],
+            'max': self.max,
+        }
+
+
+class LoopStats:
+    """
+    Timing of the oven control loop: the duration of every stage of a tick, the period between ticks,
+    how late ticks start after their deadline and how often a tick ran past the next deadline (overruns)
+    and how many ticks were skipped because of it, all in seconds.
+    """
+
+    def __init__(self, time_step, capacity=1024):
+        self.time_step = time_step
+        self.capacity = capacity
+        self.stages = {}
+        self.period = RollingStats(capacity)
+        # period minus time_step, how late every tick started
+        self.jitter = RollingStats(capacity)
+        self.lateness = RollingStats(capacity)
+        self.overruns = 0
+        self.skipped = 0
+        self._last_tick = None
+
+    def tick(self, now):
+        """Record the start of a tick at clock time now."""
+        if self._last_tick is not None:
+            period = now - self._last_tick
+            self.period.add(period)
+            self.jitter.add(period - self.time_step)
+        self._last_tick = now
+
+    def wake(self, deadline, now):
+        """Record how late the loop woke up for the tick due at deadline."""
+        self.lateness.add(max(0.0, now - deadline))
+
+    def overrun(self, skipped=0):
+        """Record a tick that ran past the next deadline and the number of ticks skipped to get back on time."""
+        self.overruns += 1
+        self.skipped += skipped
+
+    def pause(self):
+        """Forget the last tick, the loop is idle and the next period shouldn't count the pause."""
+        self._last_tick = None
+
+    def record(self, stage, seconds):
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = RollingStats(self.capacity)
+        stats.add(seconds)
+
+    def summary(self):
+        return {
+            'time_step': self.time_step,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'period': self.period.summary(),
+            'jitter': self.jitter.summary(),
+            'lateness': self.lateness.summary(),
+            'stages': {stage: stats.summary() for stage, stats in self.stages.items()},
+        }
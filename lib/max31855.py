@@ -1,7 +1,16 @@
 #!/usr/bin/python
-import RPi.GPIO as GPIO
 import math
 
+# only needed by the interface that is used
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    GPIO = None
+try:
+    import spidev
+except ImportError:
+    spidev = None
+
 class MAX31855(object):
     '''Python driver for [MAX38155 Cold-Junction Compensated Thermocouple-to-Digital Converter](http://www.maximintegrated.com/datasheet/index.mvp/id/7273)
      Requires:
@@ -9,7 +18,7 @@ class MAX31855(object):
      - A [Raspberry Pi](http://www.raspberrypi.org/)
 
     '''
-    def __init__(self, cs_pin, clock_pin, data_pin, units = "c", board = GPIO.BCM):
+    def __init__(self, cs_pin, clock_pin, data_pin, units = "c", board = None):
         '''Initialize Soft (Bitbang) SPI bus
 
         Parameters:
@@ -20,6 +29,10 @@ class MAX31855(object):
         - board:     (optional) pin numbering method as per RPi.GPIO library (GPIO.BCM (default) | GPIO.BOARD)
 
         '''
+        if GPIO is None:
+            raise ImportError("RPi.GPIO is needed for the bitbang interface")
+        if board is None:
+            board = GPIO.BCM
         self.cs_pin = cs_pin
         self.clock_pin = clock_pin
         self.data_pin = data_pin
@@ -230,6 +243,45 @@ class MAX31855(object):
             b9 * pow(voltageSum, 9.0))
 
 
+class MAX31855SPI(MAX31855):
+    '''MAX31855 on the hardware SPI bus, the 4 byte frame is read with a single spidev transfer.
+
+    Wiring: SO to MISO, SCK to SCLK and CS to CE0 or CE1 of the bus. Decoding and error flags are
+    the same as for the bitbang interface.
+    '''
+    def __init__(self, bus = 0, device = 0, units = "c", max_speed_hz = 4000000, spi = None):
+        '''Open the SPI device
+
+        Parameters:
+        - bus:          SPI bus number, 0 is /dev/spidev0.*
+        - device:       chip select of the bus, 0 for CE0 or 1 for CE1
+        - units:        (optional) unit of measurement to return. ("c" (default) | "k" | "f")
+        - max_speed_hz: (optional) SPI clock, the MAX31855 supports up to 5 MHz
+        - spi:          (optional) an already created spidev.SpiDev like object, e.g. FakeSpiDev of the tests
+
+        '''
+        if spi is None:
+            if spidev is None:
+                raise ImportError("spidev is needed for the spi interface")
+            spi = spidev.SpiDev()
+        self.spi = spi
+        self.spi.open(bus, device)
+        self.spi.max_speed_hz = max_speed_hz
+        # clock idles low, data is read on the rising edge
+        self.spi.mode = 0
+        self.units = units
+        self.data = None
+        self.noConnection = self.shortToGround = self.shortToVCC = self.unknownError = False
+
+    def read(self):
+        '''Reads the 32 bit frame with one transfer & stores it as an integer in self.data.'''
+        self.data = int.from_bytes(bytes(self.spi.readbytes(4)), "big")
+
+    def cleanup(self):
+        '''Release the SPI device'''
+        self.spi.close()
+
+
 class MAX31855Error(Exception):
      def __init__(self, value):
          self.value = value
@@ -89,6 +89,9 @@ class MAX31856(object):
     MAX31856_S_TYPE = 0x6 # Read S Type Thermocouple
     MAX31856_T_TYPE = 0x7 # Read T Type Thermocouple
 
+    # Conversions averaged on the chip for each avgsel value
+    AVERAGED_SAMPLES = (1, 2, 4, 8, 16)
+
     def __init__(self, tc_type=MAX31856_S_TYPE, units="c", avgsel=0x0, ac_freq_50hz=False, ocdetect=0x1, software_spi=None, hardware_spi=None, gpio=None):
         """
         Initialize MAX31856 device with software SPI on the specified CLK,
@@ -229,6 +232,15 @@ class MAX31856(object):
 
         return temp_c
 
+    def read_temp_and_fault(self):
+        """
+        Return the thermocouple temperature in degrees celsius and the fault status register,
+        read with a single transfer of the LTCBH, LTCBM, LTCBL and SR registers.
+        """
+        val_high_byte, val_mid_byte, val_low_byte, fault = self._read_registers(self.MAX31856_REG_READ_LTCBH, 4)
+        temp_c = MAX31856._thermocouple_temp_from_bytes(val_low_byte, val_mid_byte, val_high_byte)
+        return temp_c, fault
+
     def read_fault_register(self):
         """Return bytes containing fault codes and hardware problems.
 
@@ -261,6 +273,16 @@ class MAX31856(object):
             (address & 0xFFFF), (value & 0xFFFF)))
         return value
 
+    def _read_registers(self, address, count):
+        """
+        Reads count consecutive registers starting at address in one transfer, the MAX31856
+        increments the address after every byte while CS stays low.
+        """
+        raw = self._spi.transfer([address] + [0x00] * count)
+        if raw is None or len(raw) != count + 1:
+            raise RuntimeError('Did not read expected number of bytes from device!')
+        return list(raw[1:])
+
     def _write_register(self, address, write_value):
         """
         Writes to a register at address from the MAX31856
@@ -303,16 +325,24 @@ class MAX31856(object):
         '''Convert celsius to fahrenheit.'''
         return celsius * 9.0/5.0 + 32
 
-    def checkErrors(self):
-        data = self.read_fault_register()
+    def checkErrors(self, data=None):
+        if data is None:
+            data = self.read_fault_register()
         self.noConnection = (data & 0x00000001) != 0
         self.unknownError = (data & 0xfe) != 0
 
     def get(self):
-        self.checkErrors()
-        celcius = self.read_temp_c()
+        # in continuous mode the registers always hold the latest (averaged) conversion,
+        # the fault status comes with it in the same transfer.
+        celcius, fault = self.read_temp_and_fault()
+        if fault or self.noConnection or self.unknownError:
+            self.checkErrors(fault)
         return getattr(self, "to_" + self.units)(celcius)
 
+    def cleanup(self):
+        '''Stop conversions'''
+        self._write_register(self.MAX31856_REG_WRITE_CR0, 0)
+
 
 if __name__ == "__main__":
 
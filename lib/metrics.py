@@ -0,0 +1,139 @@
+import bisect
+
+
+def _escape(value):
+    # the text format only allows these three escapes in label values
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value):
+    if value is None:
+        return 'NaN'
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+def _labelled(label, function):
+    """
+    Yield (labels, value) of the dict function returns, keyed by the value of label, or by a tuple of values
+    if label is a tuple of label names.
+    """
+    names = label if isinstance(label, tuple) else (label,)
+    for key, value in function().items():
+        yield dict(zip(names, key if isinstance(label, tuple) else (key,))), value
+
+
+class Counter:
+    """
+    A value that only goes up. Either incremented where it happens, or read at scrape time from function,
+    for counters something else keeps anyway.
+
+    With label, function returns a dict of label value to value, e.g. a value for every kiln.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, function=None, label=None):
+        self.name = name
+        self.help_text = help_text
+        self.function = function
+        self.label = label
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        if self.label is None:
+            yield self.name, None, self.function() if self.function else self.value
+            return
+        for labels, value in _labelled(self.label, self.function):
+            yield self.name, labels, value
+
+
+class Gauge(Counter):
+    """A value that goes up and down, set where it changes or read at scrape time from function."""
+
+    kind = 'gauge'
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """
+    Counts of observed values in fixed buckets, plus their sum and count.
+
+    The bucket counts are a preallocated list, observe is a bisect and two additions. function may return the
+    Histogram to report at scrape time, for one owned by an object that gets replaced, or None if there is none.
+    With label, it returns a dict of label value to Histogram.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=(), function=None, label=None):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.function = function
+        self.label = label
+        # the last slot counts values above the highest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        if self.label is None:
+            sources = [({}, self.function() if self.function else self)]
+        else:
+            sources = _labelled(self.label, self.function)
+        for labels, source in sources:
+            if source is None:
+                continue
+            cumulative = 0
+            for bound, count in zip(source.buckets + (float('inf'),), source.counts):
+                cumulative += count
+                yield self.name + '_bucket', dict(labels, le=_format_value(bound)), cumulative
+            yield self.name + '_sum', labels, source.sum
+            yield self.name + '_count', labels, source.count
+
+
+class Registry:
+    """Metrics of the controller, rendered in the Prometheus text format for /metrics."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, function=None, label=None):
+        return self.add(Counter(name, help_text, function, label))
+
+    def gauge(self, name, help_text, function=None, label=None):
+        return self.add(Gauge(name, help_text, function, label))
+
+    def histogram(self, name, help_text, buckets=(), function=None, label=None):
+        return self.add(Histogram(name, help_text, buckets, function, label))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
@@ -3,7 +3,10 @@ import logging
 import time
 
 from gevent import sleep, Greenlet
+from gevent.event import Event
 
+from lib.clock import Clock
+from lib.loop_stats import LoopStats
 from lib.pid import PID
 
 log = logging.getLogger(__name__)
@@ -12,14 +15,20 @@ log = logging.getLogger(__name__)
 class Oven(Greenlet):
     # parent oven class. this has all the common code for either a real or simulated oven
 
-    def __init__(self, configuration):
+    def __init__(self, configuration, clock=None):
         super(Oven, self).__init__()
         self.config = configuration
         self.is_simulation = None
         self.startat = 0
-        self.pid = PID(configuration=self.config)
+        # real ovens follow the wall clock, simulations may run on a faster virtual clock.
+        self.clock = clock or Clock()
+        # monotonic clock time the next RUNNING tick is due, None when not running
+        self.next_tick = None
+        self.pid = PID(configuration=self.config, time_function=self.tick_time)
         # heating or not?
         self.heat = 0
+        # PID output of the last tick, the share of the time the heat is on
+        self.duty = 0
         self.target = 0
         self.start_time = None
         self.time_stamp = 0
@@ -31,6 +40,12 @@ class Oven(Greenlet):
         self.daemon = True
         self.temperature = 0
         self.time_step = self.config.sensor_time_wait
+        self.loop_stats = LoopStats(self.time_step)
+        # the last deadline that had already passed when the loop fell behind, catch_up runs the ticks up to
+        # it back to back without counting them as overruns again
+        self.catch_up_until = None
+        # set after every RUNNING tick, so the watcher can sample each one however fast the clock runs
+        self.tick_done = Event()
         # used for safety check to make sure if heat is being applied
         # we are close to temp or temp is increasing.
         self.previous_temperature = None
@@ -44,6 +59,8 @@ class Oven(Greenlet):
 
     def die(self):
         self._running = False
+        if self.temp_sensor:
+            self.temp_sensor.stop()
 
     def _reset_oven_state(self):
         self.cost = 0
@@ -56,18 +73,21 @@ class Oven(Greenlet):
         self.state = "COMPLETE"
         self.target = 0
         self.heat = 0
+        self.duty = 0
 
     def abort(self):
         log.info('abort-->')
         self.state = "ABORTED"
         self.target = 0
         self.heat = 0
+        self.duty = 0
 
     def stop(self):
         log.info('stop-->')
         self.state = "IDLE"
         self.target = 0
         self.heat = 0
+        self.duty = 0
 
     def create_temp_sensor(self):
         raise NotImplementedError("This method should be overridden in child classes")
@@ -77,19 +97,41 @@ class Oven(Greenlet):
 
         self.startat = startat * 60
         self.time_stamp = self.startat
-        self.start_time = datetime.datetime.now() - datetime.timedelta(seconds=self.startat)
+        self.start_time = self.clock.now() - datetime.timedelta(seconds=self.startat)
         self.profile = profile
         self.total_time = profile.get_duration()
         self.state = "RUNNING"
         log.info("Running schedule %s starting at %d minutes" % (profile.name, startat))
         log.info("Starting")
 
+    def get_checkpoint(self):
+        """Return what is needed to resume the running profile after a restart."""
+        return {
+            'profile': {'name': self.profile.name, 'data': self.profile.temp_cycle_steps},
+            # runtime already includes the time added by kiln_must_catch_up
+            'time_stamp': self.time_stamp,
+            'temperature': self.temperature,
+            'cost': self.cost,
+            'pid': self.pid.get_state(),
+        }
+
+    def resume(self, profile, checkpoint):
+        """Run profile from the point a checkpoint was taken."""
+        self.run_profile(profile, startat=checkpoint['time_stamp'] / 60)
+        self.cost = checkpoint['cost']
+        self.pid.set_state(checkpoint['pid'])
+
     def determine_heat(self):
         # Compute the PID output for the current target and temperature
+        start = time.perf_counter()
         pid_output = self.pid.compute(self.target, self.temperature)
+        self.duty = min(1.0, max(0.0, pid_output))
+        computed = time.perf_counter()
+        self.loop_stats.record('pid', computed - start)
 
         # Apply heating or cooling based on PID output.
         self.apply_heat(pid_output)
+        self.loop_stats.record('apply_heat', time.perf_counter() - computed)
         self.log_heating(pid_output)
 
     def apply_heat(self, pid_output):
@@ -113,10 +155,10 @@ class Oven(Greenlet):
             temperature_difference = self.target - self.temperature
             if temperature_difference > self.config.profile_pause_window:
                 log.info("kiln must catch up, too cold")
-                self.start_time = datetime.datetime.now() - datetime.timedelta(milliseconds=self.time_stamp * 1000)
+                self.start_time = self.clock.now() - datetime.timedelta(milliseconds=self.time_stamp * 1000)
 
     def update_runtime(self):
-        runtime_delta = datetime.datetime.now() - self.start_time
+        runtime_delta = self.clock.now() - self.start_time
         self.time_stamp = max(0.0, round(runtime_delta.total_seconds(), 2))
 
     def update_target_temp(self):
@@ -152,7 +194,8 @@ class Oven(Greenlet):
             'heat': round(self.heat, 2),
             'total_time': self.total_time,
             'profile': self.profile.name if self.profile else None,
-            'is_simulation': self.is_simulation}
+            'is_simulation': self.is_simulation,
+            'speed': self.clock.speed}
         log.debug(state)
         return state
 
@@ -162,7 +205,7 @@ class Oven(Greenlet):
 
     def check_temperature_increase(self):
         # Fetch current time
-        current_time = time.monotonic()
+        current_time = self.clock.monotonic()
 
         # Log current time, temperature and target temperature
         log.debug(f"*******Current time: {current_time}, temp: {self.temperature}, target: {self.target}")
@@ -196,25 +239,73 @@ class Oven(Greenlet):
         # Update previous temperature for the next function call
         self.previous_temperature = self.temperature
 
+    def run_step(self):
+        # one tick of the control loop, every stage is timed, determine_heat times its own parts
+        stats = self.loop_stats
+        stats.tick(self.clock.monotonic())
+        for stage in (self.update_temperature, self.update_cost, self.kiln_must_catch_up, self.update_runtime,
+                      self.update_target_temp, self.determine_heat, self.check_temperature_increase,
+                      self.reset_if_emergency, self.reset_if_schedule_ended):
+            start = time.perf_counter()
+            stage()
+            if stage != self.determine_heat:
+                stats.record(stage.__name__, time.perf_counter() - start)
+
+    def tick_time(self):
+        """
+        The deadline of the running tick, the time the PID runs on. Ticks are time_step apart for the PID even
+        when catch_up runs them back to back, only skipped ticks make a longer step.
+        """
+        return self.clock.monotonic() if self.next_tick is None else self.next_tick
+
+    def wait_for_next_tick(self):
+        # ticks are due on a grid of absolute deadlines, so the time spent in a tick doesn't push the next one later
+        self.next_tick += self.time_step
+        now = self.clock.monotonic()
+        if self.catch_up_until is not None and self.next_tick > self.catch_up_until:
+            self.catch_up_until = None
+        if now >= self.next_tick and self.catch_up_until is None:
+            # the tick ran past the next deadline, missed counts the deadlines already passed
+            missed = int((now - self.next_tick) // self.time_step) + 1
+            if self.config.loop_overrun_policy == "catch_up" and missed <= self.config.loop_max_catch_up:
+                self.loop_stats.overrun()
+                self.catch_up_until = self.next_tick + (missed - 1) * self.time_step
+            else:
+                self.loop_stats.overrun(skipped=missed)
+                self.next_tick += missed * self.time_step
+        self.clock.sleep_until(self.next_tick)
+        self.loop_stats.wake(self.next_tick, self.clock.monotonic())
+
+    def wait_for_tick(self, timeout=None):
+        """Wait until a RUNNING tick completed since the last call, return False if none did within timeout."""
+        done = self.tick_done.wait(timeout)
+        self.tick_done.clear()
+        return done
+
+    def get_loop_stats(self):
+        return {'loop': self.loop_stats.summary(),
+                'sensor': self.temp_sensor.get_stats() if self.temp_sensor is not None else None}
+
     def _run(self):
         while self._running:
+            if self.state != "RUNNING":
+                self.next_tick = self.catch_up_until = None
+                self.loop_stats.pause()
+
             if self.state == "IDLE":
                 log.debug(f"timestamp: {self.time_stamp}, state: {self.state}, temperature: {self.temperature}")
                 sleep(self.config.idle_sample_time)
                 self.update_temperature()
             elif self.state == "RUNNING":
-                self.update_temperature()
-                self.update_cost()
-                self.kiln_must_catch_up()
-                self.update_runtime()
-                self.update_target_temp()
-                self.determine_heat()
-                self.check_temperature_increase()
-                self.reset_if_emergency()
-                self.reset_if_schedule_ended()
+                if self.next_tick is None:
+                    self.next_tick = self.clock.monotonic()
+                self.run_step()
+                self.tick_done.set()
+                if self.state == "RUNNING":
+                    self.wait_for_next_tick()
             elif self.state == "COMPLETE":
                 log.debug(f"runtime: {self.time_stamp}, state: {self.state}, temperature: {self.temperature}")
-                sleep(self.config.idle_sample_time)
+                self.clock.sleep(self.config.idle_sample_time)
                 self.update_runtime()
                 self.update_temperature()
             else:
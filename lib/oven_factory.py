@@ -7,10 +7,11 @@ class OvenFactory:
     SIMULATED = 'SIMULATED'
 
     @staticmethod
-    def create_oven(oven_type, configuration):
+    def create_oven(oven_type, configuration, speed=1):
+        # speed only applies to simulations, real kilns always run in real time.
         if oven_type == OvenFactory.REAL:
             return RealOven(configuration)
         elif oven_type == OvenFactory.SIMULATED:
-            return SimulatedOven(configuration)
+            return SimulatedOven(configuration, speed=speed)
         else:
             raise Exception(f"Invalid oven type: {oven_type}")
@@ -1,23 +1,44 @@
 import datetime
 import logging
+import time
 
 from gevent import Greenlet
 
 from lib.profile import Profile
+from lib.telemetry import TelemetryEncoder
+from lib.temperature_history import TemperatureHistory
 
 log = logging.getLogger(__name__)
 
 
 class OvenWatcher(Greenlet):
-    def __init__(self, oven, configuration, socketio=None, profile: Profile = None):
+    def __init__(self, oven, configuration, socketio=None, profile: Profile = None, firing_store=None,
+                 checkpoint=None, room=None):
         super(OvenWatcher, self).__init__()
         self.config = configuration
-        self.temperature_history = None
+        self.temperature_history = TemperatureHistory()
         self.start_time = None
         self.oven = oven
         self.socketio = socketio  # Store the SocketIO instance
+        # Socket.IO room of the clients following this oven, None for all clients
+        self.room = room
         self.active_profile = profile
         self.greenlet = None
+        # bumped whenever the backlog changes, so cached copies of it can tell when they are stale
+        self.version = 0
+        self._backlog = None
+        self._backlog_version = None
+        self.telemetry = TelemetryEncoder(self.config.telemetry_keyframe_interval, self.config.telemetry_msgpack)
+        # optional FiringStore, every run is recorded there, id of the one being recorded
+        self.firing_store = firing_store
+        self.run_id = None
+        # time_stamp of the last sample recorded, a smaller one means a new firing
+        self.last_time_stamp = None
+        # optional RunCheckpoint, real firings are checkpointed there while running
+        self.checkpoint = checkpoint
+        # messages emitted, for the metrics, and the monotonic time of the last one
+        self.emits = 0
+        self.last_emit = None
 
     def _add_id(self):
         """Helper method to standardize log messages with instance identifier."""
@@ -26,54 +47,122 @@ class OvenWatcher(Greenlet):
 
     # Needed for swapping out oven after initial program initialization
     def set_oven(self, oven):
+        # a new oven is a new firing, resume_run picks up the run of a resumed one
+        self.end_run()
         self.oven = oven
 
     def reset_temp_history(self):
-        self.temperature_history = []
+        self.temperature_history.clear()
+        self.version += 1
 
     def _run(self):
         self.start_time = datetime.datetime.now()
-        self.temperature_history = []
+        self.reset_temp_history()
 
         while True:
             oven_status = self.oven.get_status()
             oven_state = oven_status.get("state")
+            self.record(oven_status)
+            self.save_checkpoint(oven_state)
 
             if oven_state == "RUNNING":
                 self.temperature_history.append(oven_status)
-                self.socketio.sleep(self.oven.time_step)
+                self.version += 1
+                # one sample per tick of the oven, simulations tick faster than the wall clock
+                self.oven.wait_for_tick(self.oven.time_step)
             elif oven_state == "COMPLETE":
                 self.temperature_history.append(oven_status)
+                self.version += 1
                 self.socketio.sleep(self.config.idle_sample_time)
             elif oven_state == "IDLE":
                 if len(self.temperature_history) > 0:
                     self.reset_temp_history()
-                self.active_profile = None
+                if self.active_profile is not None:
+                    self.active_profile = None
+                    self.version += 1
                 self.socketio.sleep(self.config.idle_sample_time)
             else:
                 self.socketio.sleep(self.config.idle_sample_time)
 
-            if self.socketio:
+            if self.socketio and self.should_emit(oven_state):
                 log.debug("Emit oven_update")
-                self.socketio.emit('oven_update', oven_status)
+                self.socketio.emit('oven_update', self.telemetry.encode(oven_status), to=self.room)
+                self.emits += 1
+
+    def should_emit(self, oven_state):
+        """
+        Send at most one update of a running oven per time_step of wall clock time. A fast simulation ticks far
+        more often, its samples are all recorded and reach clients through the history.
+        """
+        now = time.monotonic()
+        if oven_state == "RUNNING" and self.last_emit is not None and now - self.last_emit < self.oven.time_step:
+            return False
+        self.last_emit = now
+        return True
+
+    def record(self, oven_status):
+        """Append the status to the firing store, starting a run when the oven starts and ending it when it stops."""
+        if self.firing_store is None:
+            return
+        state = oven_status.get("state")
+        time_stamp = oven_status.get("time_stamp") or 0
+        if self.last_time_stamp is not None and time_stamp < self.last_time_stamp:
+            # the oven started over, don't overwrite the samples of the previous firing
+            self.end_run()
+        try:
+            if state == "RUNNING" and self.run_id is None:
+                self.run_id = self.firing_store.start_run(oven_status)
+            if self.run_id is None:
+                return
+            if state in ("RUNNING", "COMPLETE"):
+                self.firing_store.append(self.run_id, oven_status)
+                self.last_time_stamp = time_stamp
+            else:
+                self.end_run(state)
+        except Exception as e:
+            # losing history must never stop the oven updates
+            log.error(f"Error recording firing: {e}")
+
+    def end_run(self, state="IDLE"):
+        """Close the run being recorded, if any."""
+        run_id, self.run_id, self.last_time_stamp = self.run_id, None, None
+        if self.firing_store is None or run_id is None:
+            return
+        try:
+            self.firing_store.end_run(run_id, state)
+        except Exception as e:
+            log.error(f"Error ending firing {run_id}: {e}")
+
+    def save_checkpoint(self, oven_state):
+        if self.checkpoint is None:
+            return
+        if oven_state == "RUNNING" and not self.oven.is_simulation:
+            self.checkpoint.save(dict(self.oven.get_checkpoint(), run_id=self.run_id))
+        elif self.checkpoint.saved:
+            # the firing ended, nothing to resume
+            self.checkpoint.clear()
+
+    def resume_run(self, run_id):
+        """Keep recording to the run of a resumed firing instead of starting a new one."""
+        if self.firing_store is None or run_id is None:
+            return
+        try:
+            if self.firing_store.resume_run(run_id):
+                self.run_id = run_id
+        except Exception as e:
+            log.error(f"Error resuming firing {run_id}: {e}")
 
     def sampled_temp_history(self, max_points=500):
-        # First, sort the temperature history by 'time_stamp' (timestamp)
-        sorted_temperature_history = sorted(self.temperature_history, key=lambda x: x['time_stamp'])
-
-        total_points = len(sorted_temperature_history)
-        if total_points <= max_points:
-            points = sorted_temperature_history
-        else:
-            every_nth = max(1, total_points // (max_points - 1))  # Avoid division by zero
-            points = sorted_temperature_history[::every_nth]
-
+        # samples are appended in time_stamp order, no need to sort
+        points = self.temperature_history.sample(max_points)
         log.info(f"Returning {len(points)} points from the current run")
         return points
 
     def set_profile(self, profile: Profile):
         """Set the current profile and notify clients."""
+        self.end_run()
         self.active_profile = profile
+        self.version += 1
         log.info(f"Profile set to: {profile.name}")
 
     def get_profile_data(self):
@@ -86,14 +175,22 @@ class OvenWatcher(Greenlet):
             }
         return None  # Return None if there's no active profile
 
-    def send_backlog(self):
-        """Sends backlog data to requesting clients."""
-        if self.socketio:
-            profile_data = self.get_profile_data()
-            backlog = {
+    def get_backlog(self):
+        """Return the backlog of the current run, rebuilt only when it changed."""
+        if self._backlog_version != self.version:
+            self._backlog = {
                 'type': "backlog",
-                'profile': profile_data,
+                'profile': self.get_profile_data(),
                 'log': self.sampled_temp_history(),
             }
-            self.socketio.emit('backlog_data', backlog)
-            log.info(F"Backlog data sent to requesting client:{backlog}")
+            self._backlog_version = self.version
+        return self._backlog
+
+    def send_backlog(self, sid=None):
+        """Sends backlog data to the requesting client, or to every client following this oven if sid is None."""
+        if self.socketio:
+            backlog = self.get_backlog()
+            self.socketio.emit('backlog_data', backlog, to=sid or self.room)
+            self.emits += 1
+            log.info(f"Backlog data with {len(backlog['log'])} points sent to {sid or self.room or 'all clients'}")
+            log.debug(f"Backlog data: {backlog}")
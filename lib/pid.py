@@ -61,6 +61,19 @@ class PID:
         self._last_input = 0  # Initialize _last_input to 0
         self._last_error = 0  # Initialize _last_error to 0
 
+    def get_state(self):
+        """Return the internal state needed to continue where the controller left off."""
+        return {'integral': self._integral, 'last_input': self._last_input, 'last_error': self._last_error,
+                'last_output': self._last_output}
+
+    def set_state(self, state):
+        """Continue from a state returned by get_state(), the time since then is not integrated."""
+        self._integral = _clamp(state['integral'], self.int_limits)
+        self._last_input = state['last_input']
+        self._last_error = state['last_error']
+        self._last_output = state['last_output']
+        self._last_time = self.get_current_time()
+
     def get_current_time(self):
         return self.time_function()
 
@@ -0,0 +1,99 @@
+import logging
+import multiprocessing
+import os
+import types
+
+import numpy as np
+
+from lib.batch_simulator import BatchSimulator
+from lib.profile import Profile
+
+log = logging.getLogger(__name__)
+
+# candidates that don't finish the profile are ranked last
+FAILED_SCORE = float("inf")
+
+
+def config_snapshot(configuration, **overrides):
+    """Copy the plain settings of a configuration module so they can be sent to worker processes."""
+    values = {name: getattr(configuration, name) for name in dir(configuration)
+              if not name.startswith('_') and isinstance(getattr(configuration, name),
+                                                         (bool, int, float, str, tuple, list, dict, type(None)))}
+    values.update(overrides)
+    return types.SimpleNamespace(**values)
+
+
+def gain_grid(kp, ki, kd, span, steps):
+    """Return kp, ki, kd arrays for a log-spaced grid of steps^3 gains from value / span to value * span."""
+    axes = [np.geomspace(value / span, value * span, steps) if value else np.zeros(1) for value in (kp, ki, kd)]
+    return [axis.ravel() for axis in np.meshgrid(*axes, indexing='ij')]
+
+
+def score(results, duration, overshoot_weight, switch_weight):
+    """
+    Rank candidates by rms tracking error, plus penalties for overshoot and for relay switches per hour.
+    Lower is better.
+    """
+    switches_per_hour = results['switches'] / max(duration / 3600, 1e-9)
+    scores = (results['rms_error'] + overshoot_weight * np.maximum(results['max_overshoot'], 0)
+              + switch_weight * switches_per_hour)
+    return np.where(results['state'] == "COMPLETE", scores, FAILED_SCORE)
+
+
+def _evaluate(configuration, profile_dict, kp, ki, kd):
+    simulator = BatchSimulator(configuration, len(kp), pid_kp=kp, pid_ki=ki, pid_kd=kd)
+    return simulator.run(Profile(profile_dict))
+
+
+def evaluate(configuration, profile_dict, kp, ki, kd, processes=None):
+    """Simulate every kp, ki, kd candidate through the profile, spread over processes (default: all cores)."""
+    processes = processes or os.cpu_count() or 1
+    chunks = [chunk for chunk in zip(*(np.array_split(gains, processes) for gains in (kp, ki, kd))) if len(chunk[0])]
+    snapshot = config_snapshot(configuration)
+
+    if len(chunks) == 1:
+        parts = [_evaluate(snapshot, profile_dict, *chunks[0])]
+    else:
+        with multiprocessing.Pool(len(chunks)) as pool:
+            parts = pool.starmap(_evaluate, [(snapshot, profile_dict) + chunk for chunk in chunks])
+
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def search(configuration, profile_dict, strategy="grid", span=10.0, steps=8, rounds=4,
+           overshoot_weight=0.5, switch_weight=0.001, processes=None):
+    """
+    Search PID gains for profile_dict, starting from the gains in the configuration.
+
+    grid evaluates one log-spaced grid of steps^3 candidates. adaptive repeats the grid
+    rounds times, each time centered on the best candidate so far with a narrower span.
+    Returns all evaluated candidates as a list of dicts, best first.
+    """
+    duration = Profile(profile_dict).get_duration()
+    best = (configuration.pid_kp, configuration.pid_ki, configuration.pid_kd)
+    candidates = []
+
+    for search_round in range(rounds if strategy == "adaptive" else 1):
+        kp, ki, kd = gain_grid(*best, span=span, steps=steps)
+        log.info(f"Round {search_round + 1}: evaluating {len(kp)} candidates around kp={best[0]:.4g}, "
+                 f"ki={best[1]:.4g}, kd={best[2]:.4g}, span={span:.3g}")
+        results = evaluate(configuration, profile_dict, kp, ki, kd, processes)
+        scores = score(results, duration, overshoot_weight, switch_weight)
+
+        for i in range(len(kp)):
+            candidates.append({
+                'kp': float(kp[i]), 'ki': float(ki[i]), 'kd': float(kd[i]),
+                'score': float(scores[i]),
+                'state': str(results['state'][i]),
+                'rms_error': float(results['rms_error'][i]),
+                'mean_abs_error': float(results['mean_abs_error'][i]),
+                'max_overshoot': float(results['max_overshoot'][i]),
+                'switches': int(results['switches'][i]),
+                'cost': float(results['cost'][i]),
+            })
+
+        candidates.sort(key=lambda candidate: candidate['score'])
+        best = (candidates[0]['kp'], candidates[0]['ki'], candidates[0]['kd'])
+        span = span ** 0.5
+
+    return candidates
@@ -1,4 +1,4 @@
-import json
+import bisect
 from typing import Tuple, Optional
 
 
@@ -7,32 +7,76 @@ class Profile:
         self.name = profile_dict["name"]
         self.temp_cycle_steps = sorted(profile_dict["data"], key=lambda x: x[0])
 
+        # precompiled form of the profile for fast lookups, slopes are None for zero length segments.
+        self._times = [float(point[0]) for point in self.temp_cycle_steps]
+        self._temps = [float(point[1]) for point in self.temp_cycle_steps]
+        self._slopes = [(self._temps[i] - self._temps[i - 1]) / (self._times[i] - self._times[i - 1])
+                        if self._times[i] != self._times[i - 1] else None
+                        for i in range(1, len(self._times))]
+        self._duration = self.temp_cycle_steps[-1][0] if self.temp_cycle_steps else 0
+        # index of the end point of the last segment used, runtime mostly moves forward one segment at a time.
+        self._cursor = 1
+        # numpy copies of the above, built on first use of get_target_temperatures()
+        self._arrays = None
+
     def get_duration(self) -> int:
         """Return the duration of the profile."""
-        return self.temp_cycle_steps[-1][0] if self.temp_cycle_steps else 0
+        return self._duration
 
     def get_target_temperature(self, current_time: int) -> float:
         """Calculate and return the target temperature at the given current_time."""
-        if current_time > self.get_duration():
+        if current_time > self._duration or len(self._times) < 2 or current_time < self._times[0]:
             return 0
 
-        prev_point, next_point = self._get_surrounding_points(current_time)
-
-        if prev_point is None or next_point is None or prev_point[0] == next_point[0]:
+        index = self._segment_index(current_time)
+        slope = self._slopes[index - 1]
+        if slope is None:
             return 0
 
-        slope = (float(next_point[1]) - float(prev_point[1])) / (float(next_point[0]) - float(prev_point[0]))
-        temp = prev_point[1] + (current_time - prev_point[0]) * slope
+        temp = self._temps[index - 1] + (current_time - self._times[index - 1]) * slope
         return round(temp, 2)
 
+    def get_target_temperatures(self, times):
+        """Return the target temperatures for a numpy array of times, 0 outside the profile."""
+        import numpy as np
+
+        times = np.asarray(times, dtype=float)
+        if len(self._times) < 2:
+            return np.zeros_like(times)
+
+        if self._arrays is None:
+            self._arrays = (np.array(self._times), np.array(self._temps),
+                            np.array([np.nan if slope is None else slope for slope in self._slopes]))
+        profile_times, profile_temps, slopes = self._arrays
+
+        indexes = np.clip(np.searchsorted(profile_times, times, side='right'), 1, len(profile_times) - 1)
+        segment_slopes = slopes[indexes - 1]
+        temps = profile_temps[indexes - 1] + (times - profile_times[indexes - 1]) * segment_slopes
+
+        outside = (times < profile_times[0]) | (times > self._duration) | np.isnan(segment_slopes)
+        return np.round(np.where(outside, 0.0, temps), 2)
+
+    def _segment_index(self, runtime) -> int:
+        """Return the index of the end point of the segment containing runtime, reusing the last one if possible."""
+        last = len(self._times) - 1
+        cursor = self._cursor
+        while cursor < last and runtime >= self._times[cursor]:
+            if cursor + 1 < last and runtime >= self._times[cursor + 1]:
+                # jumped more than one segment ahead, search the rest
+                cursor = min(bisect.bisect_right(self._times, runtime, cursor + 1), last)
+                break
+            cursor += 1
+        if runtime < self._times[cursor - 1]:
+            # went back in time
+            cursor = min(max(bisect.bisect_right(self._times, runtime), 1), last)
+        self._cursor = cursor
+        return cursor
+
     def _get_surrounding_points(self, runtime: int) -> Tuple[Optional[Tuple[int, int]], Optional[Tuple[int, int]]]:
         """Return the data points surrounding the given current_time."""
         if not self.temp_cycle_steps or runtime < self.temp_cycle_steps[0][0]:
             # If current_time is before the start of the data, return None or the first point
             return None, self.temp_cycle_steps[0] if self.temp_cycle_steps else None
 
-        for i in range(1, len(self.temp_cycle_steps)):
-            if runtime < self.temp_cycle_steps[i][0]:
-                return self.temp_cycle_steps[i - 1], self.temp_cycle_steps[i]
-
-        return self.temp_cycle_steps[-2], self.temp_cycle_steps[-1]
+        index = self._segment_index(runtime)
+        return self.temp_cycle_steps[index - 1], self.temp_cycle_steps[index]
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import logging
+
+from gevent import get_hub
+
+from lib.atomic_file import write_atomic
+from lib.batch_simulator import BatchSimulator, BATCH_PARAMETERS
+from lib.profile import Profile
+
+log = logging.getLogger(__name__)
+
+# settings that change the estimate, part of the content hash so summaries are recomputed when they change.
+MODEL_SETTINGS = tuple(BATCH_PARAMETERS) + ('sensor_time_wait', 'kw_elements', 'kwh_rate', 'kiln_must_catch_up',
+                                            'profile_pause_window', 'emergency_shutoff_temp')
+
+
+class ProfileIndex:
+    """
+    Summaries of profiles (duration, peak temperature, ramp rates, estimated energy and cost),
+    keyed by a hash of the profile content and persisted to index_file, so a profile is only
+    simulated again when its points or the kiln model change.
+    """
+
+    def __init__(self, configuration, index_file):
+        self.config = configuration
+        self.index_file = index_file
+        self.summaries = {}
+        self._dirty = False
+        # summaries found in the index and computed
+        self.hits = self.misses = 0
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_file, 'r') as f:
+                self.summaries = json.load(f)
+        except FileNotFoundError:
+            self.summaries = {}
+        except Exception as e:
+            log.error(f"Error loading profile index {self.index_file}, rebuilding it: {e}")
+            self.summaries = {}
+
+    def save(self):
+        if not self._dirty:
+            return
+        try:
+            write_atomic(self.index_file, json.dumps(self.summaries))
+            self._dirty = False
+        except Exception as e:
+            log.error(f"Error saving profile index {self.index_file}: {e}")
+
+    def content_hash(self, profile_dict):
+        model = {name: getattr(self.config, name) for name in MODEL_SETTINGS}
+        content = json.dumps({'data': profile_dict['data'], 'model': model}, sort_keys=True)
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def lookup(self, profile_dict):
+        """Return the summary of profile_dict if the index has it, None if it still has to be computed."""
+        summary = self.summaries.get(self.content_hash(profile_dict))
+        if summary is not None:
+            self.hits += 1
+        return summary
+
+    def summarize(self, profile_dict):
+        """Return the summary of profile_dict, computing it if the index doesn't have it yet."""
+        key = self.content_hash(profile_dict)
+        summary = self.summaries.get(key)
+        if summary is None:
+            self.misses += 1
+            log.info(f"Computing summary of profile {profile_dict['name']}")
+            # simulate on a real thread so the control loop keeps running on the gevent hub.
+            summary = get_hub().threadpool.apply(self.compute, (profile_dict,))
+            self.summaries[key] = summary
+            self._dirty = True
+        else:
+            self.hits += 1
+        return summary
+
+    def prune(self, profile_dicts):
+        """Forget summaries of profiles that no longer exist."""
+        keys = {self.content_hash(profile_dict) for profile_dict in profile_dicts}
+        for key in set(self.summaries) - keys:
+            del self.summaries[key]
+            self._dirty = True
+
+    def compute(self, profile_dict):
+        profile = Profile(profile_dict)
+        times = [float(point[0]) for point in profile.temp_cycle_steps]
+        temps = [float(point[1]) for point in profile.temp_cycle_steps]
+        # degrees per second, like the profile's own units
+        rates = [(temps[i] - temps[i - 1]) / (times[i] - times[i - 1])
+                 for i in range(1, len(times)) if times[i] != times[i - 1]]
+
+        summary = {
+            'duration': profile.get_duration(),
+            'peak_temperature': max(temps, default=0),
+            'max_ramp_rate': max([rate for rate in rates if rate > 0], default=0),
+            'max_cool_rate': -min([rate for rate in rates if rate < 0], default=0),
+        }
+
+        if len(times) > 1:
+            simulator = BatchSimulator(self.config, 1)
+            results = simulator.run(profile)
+            summary.update({
+                'estimated_state': str(results['state'][0]),
+                # wall clock time of the run, including time spent catching up
+                'estimated_time': simulator.elapsed,
+                'estimated_kwh': round(float(results['kwh'][0]), 2),
+                'estimated_cost': round(float(results['cost'][0]), 2),
+            })
+        return summary
@@ -1,30 +1,72 @@
+import collections
 import json
 import logging
 import os
+import time
+import uuid
+
+import gevent
+
+from lib.atomic_file import write_atomic
 
 log = logging.getLogger(__name__)
 
 
 class ProfileManager:
-    def __init__(self, profile_path):
+    """
+    Loads and saves profiles in profile_path.
+
+    Profiles are kept in memory and only re-read when a file is replaced or its modification time or size changes. The directory is
+    checked at most once every check_interval seconds and the serialized profile list is built once per change.
+
+    Every change bumps revision and is recorded as an added, updated or removed event, so clients can
+    catch up from the revision they have instead of fetching the whole list.
+
+    With a profile_index, profiles get the summary the index has for them. Missing summaries are computed one
+    at a time by a background greenlet, meanwhile the profile is sent without one. When a summary is ready the
+    profile is recorded as updated and on_change is called with the revision before, to send the change.
+    """
+
+    def __init__(self, profile_path, profile_index=None, check_interval=1.0, history_size=100, on_change=None):
         self.profile_path = profile_path
+        # optional ProfileIndex, adds a summary to every profile returned by get_profiles, save_profile drops it
+        self.profile_index = profile_index
+        self.on_change = on_change
+        # filenames of profiles waiting for their summary, and the greenlet computing them
+        self._unsummarized = collections.deque()
+        self._summarizer = None
+        self.check_interval = check_interval
+        # filename -> ((inode, mtime, size), profile dict)
+        self._profiles = {}
+        self._payload = None
+        self._last_check = None
+        # revisions restart with every process, epoch tells clients which process they came from
+        self.epoch = uuid.uuid4().hex
+        self.revision = 0
+        self._changes = collections.deque(maxlen=history_size)
+
+    def invalidate(self):
+        """Force a directory check on the next access."""
+        self._last_check = None
 
     def delete_profile(self, profile):
         filename = profile + ".json"
         filepath = os.path.join(self.profile_path, filename)
         os.remove(filepath)
+        self.invalidate()
         log.info("Deleted %s" % filepath)
         return True
 
     def save_profile(self, msgdict):
         profile_obj = msgdict.get('profile')
-        profile_json = json.dumps(profile_obj)
+        # clients send back the summary refresh added to the profile, it is not part of the profile
+        profile_json = json.dumps({key: value for key, value in profile_obj.items() if key != 'summary'})
         filename = profile_obj['name'] + ".json"
         filepath = os.path.join(self.profile_path, filename)
 
         try:
-            with open(filepath, 'w+') as f:
-                f.write(profile_json)
+            write_atomic(filepath, profile_json)
+            self.invalidate()
             log.info(f"Profile '{profile_obj['name']}' saved successfully.")
             return True
         except Exception as e:
@@ -33,24 +75,124 @@ class ProfileManager:
 
     def find_profile(self, selected_profile):
         # given a selected_profile profile name, find it and return the parsed json profile object or None.
-        profiles = self.get_profiles()
-        json_profiles = json.loads(profiles)
-
-        # find the selected_profile profile
-        for profile in json_profiles:
+        for profile in self.get_profile_list():
             if profile['name'] == selected_profile:
                 return profile
         return None
 
+    def get_profile_list(self):
+        """Return the parsed profiles. The dicts are shared, don't modify them."""
+        self.refresh()
+        return self._profile_list()
+
     def get_profiles(self):
+        """Return the profiles and the revision they are at as json."""
+        self.refresh()
+        if self._payload is None:
+            self._payload = json.dumps({'epoch': self.epoch, 'revision': self.revision,
+                                        'profiles': self._profile_list()})
+        return self._payload
+
+    def get_changes(self, since, epoch=None):
+        """
+        Return the changes after revision since as {'epoch': ..., 'revision': ..., 'changes': [...]}, or None
+        if they are no longer in the history or epoch is from an earlier process, and the client has to fetch
+        the whole list.
+        """
+        self.refresh()
+        if epoch is not None and epoch != self.epoch:
+            return None
+        if since != self.revision and (
+                since > self.revision or not self._changes or self._changes[0]['revision'] > since + 1):
+            return None
+        return {'epoch': self.epoch, 'revision': self.revision,
+                'changes': [change for change in self._changes if change['revision'] > since]}
+
+    def _record_change(self, action, profile):
+        self.revision += 1
+        self._changes.append({'revision': self.revision, 'action': action, 'name': profile.get('name'),
+                              'profile': profile if action != "removed" else None})
+
+    def refresh(self):
+        """Re-read profiles that were added or modified since the last check and drop the deleted ones."""
+        now = time.monotonic()
+        if self._last_check is not None and now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+
         try:
-            profile_files = os.listdir(self.profile_path)
+            # hidden files are temp files of saves in progress
+            entries = {entry.name: (entry.inode(), entry.stat().st_mtime_ns, entry.stat().st_size)
+                       for entry in os.scandir(self.profile_path)
+                       if entry.is_file() and not entry.name.startswith('.')}
         except Exception as error:
             log.error(f"Error loading profile path: {error}")
-            profile_files = []
-        profiles = []
-        for filename in profile_files:
-            with open(os.path.join(self.profile_path, filename), 'r') as f:
-                profiles.append(json.load(f))
-        log.info(f"profiles:{profiles}")
-        return json.dumps(profiles)
+            entries = {}
+
+        changed = False
+        for filename in set(self._profiles) - set(entries):
+            self._record_change("removed", self._profiles.pop(filename)[1])
+            changed = True
+
+        for filename, signature in entries.items():
+            cached = self._profiles.get(filename)
+            if cached and cached[0] == signature:
+                continue
+            try:
+                with open(os.path.join(self.profile_path, filename), 'r') as f:
+                    profile = json.load(f)
+            except Exception as error:
+                log.error(f"Error loading profile {filename}: {error}")
+                if filename in self._profiles:
+                    self._record_change("removed", self._profiles.pop(filename)[1])
+                    changed = True
+                continue
+            if self.profile_index:
+                summary = self.profile_index.lookup(profile)
+                if summary is None:
+                    self._queue_summary(filename)
+                else:
+                    profile['summary'] = summary
+            self._profiles[filename] = (signature, profile)
+            self._record_change("updated" if cached else "added", profile)
+            changed = True
+
+        if changed:
+            self._payload = None
+            if self.profile_index:
+                self.profile_index.prune(self._profile_list())
+                self.profile_index.save()
+            log.info(f"Loaded {len(self._profiles)} profiles")
+            log.debug(f"profiles:{self._profiles}")
+
+    def _queue_summary(self, filename):
+        self._unsummarized.append(filename)
+        if self._summarizer is None or self._summarizer.dead:
+            self._summarizer = gevent.spawn(self._summarize)
+
+    def _summarize(self):
+        while self._unsummarized:
+            filename = self._unsummarized.popleft()
+            cached = self._profiles.get(filename)
+            if cached is None or 'summary' in cached[1]:
+                continue
+            try:
+                # only this greenlet waits for the simulation, it runs on a pool thread
+                summary = self.profile_index.summarize(cached[1])
+            except Exception as error:
+                log.error(f"Error summarizing profile {filename}: {error}")
+                continue
+            if self._profiles.get(filename) is not cached:
+                # replaced or removed meanwhile, a new version is queued again
+                continue
+            revision = self.revision
+            profile = dict(cached[1], summary=summary)
+            self._profiles[filename] = (cached[0], profile)
+            self._record_change("updated", profile)
+            self._payload = None
+            self.profile_index.save()
+            if self.on_change:
+                self.on_change(revision)
+
+    def _profile_list(self):
+        return [profile for signature, profile in self._profiles.values()]
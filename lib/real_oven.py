@@ -3,6 +3,7 @@ import logging
 from lib.heat_output import HeatOutput
 from lib.kill_switch import KillSwitch
 from lib.oven import Oven
+from lib.ssr_scheduler import DutyScheduler
 from lib.temp_sensor import TempSensorReal
 
 log = logging.getLogger(__name__)
@@ -13,6 +14,9 @@ class RealOven(Oven):
     def __init__(self, configuration):
         self.config = configuration
         self.output = HeatOutput(self.config)
+        # switches the output in the background, apply_heat only sets the duty
+        self.ssr = DutyScheduler.from_config(self.output, self.config)
+        self.ssr.start()
         self.complete()
 
         # call parent init
@@ -25,16 +29,20 @@ class RealOven(Oven):
         self.temp_sensor = TempSensorReal(self.config)
         self.temp_sensor.start()
 
+    def die(self):
+        self.ssr.stop()
+        super().die()
+
     def complete(self):
-        self.output.cool(0)
+        self.ssr.off()
         super().complete()
 
     def abort(self):
-        self.output.cool(0)
+        self.ssr.off()
         super().abort()
 
     def stop(self):
-        self.output.cool(0)
+        self.ssr.off()
         super().stop()
 
     # get actual temperature from sensor.
@@ -42,12 +50,6 @@ class RealOven(Oven):
         self.temperature = self.temp_sensor.temperature + self.config.thermocouple_offset
 
     def apply_heat(self, pid):
-        heat_on = float(self.time_step * pid)
-        heat_off = float(self.time_step * (1 - pid))
-
         self.heat = pid
-
-        if heat_on:
-            self.output.heat(heat_on)
-        if heat_off:
-            self.output.cool(heat_off)
+        # the scheduler does the switching
+        self.ssr.set_duty(pid)
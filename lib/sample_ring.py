@@ -0,0 +1,38 @@
+class SampleRing:
+    """
+    Fixed size ring of samples with one writer and one reader, which may run on different threads.
+
+    Neither side locks. The writer stores a sample in its slot and then bumps written; a slot assignment
+    and an integer store are atomic under the GIL. The reader remembers how many samples it has read. If the
+    writer got more than capacity ahead, the oldest unread samples were overwritten and are counted as dropped.
+    """
+
+    def __init__(self, capacity=64):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        # total samples written, only changed by the writer
+        self.written = 0
+        # total samples read or dropped, only changed by the reader
+        self.read = 0
+        self.dropped = 0
+
+    def put(self, sample):
+        self.slots[self.written % self.capacity] = sample
+        self.written += 1
+
+    def get_all(self):
+        """Return the samples written since the last call, oldest first."""
+        written = self.written
+        start = max(self.read, written - self.capacity)
+        samples = [self.slots[index % self.capacity] for index in range(start, written)]
+
+        # the writer may have lapped us while copying, drop what may have been overwritten
+        overwritten = self.written - self.capacity - start
+        if overwritten > 0:
+            samples = samples[overwritten:]
+
+        self.dropped += written - self.read - len(samples)
+        self.read = written
+        return samples
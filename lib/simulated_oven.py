@@ -1,5 +1,5 @@
 import logging
-from gevent import sleep
+from lib.clock import VirtualClock
 from lib.oven import Oven
 from lib.temp_sensor import TempSensorSimulated
 
@@ -8,7 +8,7 @@ log = logging.getLogger(__name__)
 
 class SimulatedOven(Oven):
 
-    def __init__(self, configuration):
+    def __init__(self, configuration, speed=1):
         self.config = configuration
         self.element_to_oven_heat_transfer = 0
         self.heat_transfer_rate_to_environ = 0
@@ -22,9 +22,9 @@ class SimulatedOven(Oven):
 
         # set temps to the temp of the surrounding environment
         self.element_temperature = self.environ_temp  # deg F temp of heating element
-        log.info("SimulatedOven starting")
+        log.info(f"SimulatedOven starting, speed: {speed or 'max'}")
 
-        super().__init__(configuration)
+        super().__init__(configuration, clock=VirtualClock(speed))
 
         self.temperature = configuration.simulated_room_temp
         self.is_simulation = True
@@ -38,6 +38,12 @@ class SimulatedOven(Oven):
         self.heat_energy = 0
         super().stop()
 
+    def complete(self):
+        # keep cooling after the schedule ends, but in real time so an
+        # as-fast-as-possible simulation doesn't spin the cpu forever.
+        self.clock.set_speed(1)
+        super().complete()
+
     def apply_heat(self, pid):
         # Determine the proportion of the time step the heater is on
         self.heat = max(0.0, float(self.time_step * pid))
@@ -51,8 +57,6 @@ class SimulatedOven(Oven):
                 f"{self.heat_transfer_rate_to_environ:.2f}W env"
         )
 
-        sleep(self.time_step)
-
     def update_temperature(self):
         # temperature is set directly on member variable, no need to query temp sensor.
         # just simulate the change
@@ -0,0 +1,98 @@
+import logging
+import time
+
+from gevent import sleep, Greenlet
+
+log = logging.getLogger(__name__)
+
+TIME_PROPORTIONAL = "time_proportional"
+BURST = "burst"
+
+
+class DutyScheduler(Greenlet):
+    """
+    Switches a HeatOutput to follow a duty cycle between 0 and 1, so the control loop only sets the duty
+    and returns.
+
+    time_proportional: every window seconds the output is on for duty * window, rounded to whole mains
+    half cycles, then off. Few switches, suits any SSR or a contactor.
+
+    burst: every burst_cycles mains cycles the output is either on or off, on cycles are spread evenly
+    (30% is 3 of every 10). Needs a zero-cross SSR, gives a much smoother heat input.
+
+    Switching times are kept on a monotonic grid of mains cycles, so they don't drift when the hub is busy.
+    The output pin is only written when it changes.
+    """
+
+    def __init__(self, output, mode=TIME_PROPORTIONAL, window=2.0, burst_cycles=1, mains_hz=60):
+        super(DutyScheduler, self).__init__()
+        if mode not in (TIME_PROPORTIONAL, BURST):
+            raise ValueError(f"Unknown SSR mode {mode}, use {TIME_PROPORTIONAL} or {BURST}")
+        self.output = output
+        self.mode = mode
+        self.cycle = 1 / mains_hz
+        # whole mains cycles per window, at least one
+        self.window = max(1, round(window / self.cycle)) * self.cycle
+        self.burst_step = max(1, burst_cycles) * self.cycle
+        self.duty = 0.0
+        self.is_on = None
+        self.switches = 0
+        self._running = True
+        self._accumulator = 0.0
+        self.daemon = True
+
+    @classmethod
+    def from_config(cls, output, configuration):
+        return cls(output, configuration.ssr_mode, configuration.ssr_window, configuration.ssr_burst_cycles,
+                   50 if configuration.ac_freq_50hz else 60)
+
+    def set_duty(self, duty):
+        self.duty = min(1.0, max(0.0, duty))
+
+    def off(self):
+        """Set the duty to 0 and switch off right away, without waiting for the end of the window."""
+        self.duty = 0.0
+        self._switch(False)
+
+    def stop(self):
+        self._running = False
+        self.off()
+
+    def _switch(self, on):
+        if on != self.is_on:
+            self.output.set(on)
+            self.is_on = on
+            self.switches += 1
+
+    def _run(self):
+        next_time = time.monotonic()
+        while self._running:
+            if self.mode == BURST:
+                # error diffusion, the on steps add up to the duty
+                self._accumulator += self.duty
+                on = self._accumulator >= 0.5
+                if on:
+                    self._accumulator -= 1
+                self._switch(on)
+                next_time = self._sleep_until(next_time + self.burst_step)
+            else:
+                window_start = next_time
+                # a duty change during the window applies from the next one
+                half_cycle = self.cycle / 2
+                on_time = round(self.duty * self.window / half_cycle) * half_cycle
+                if on_time > 0:
+                    self._switch(True)
+                    self._sleep_until(window_start + on_time)
+                if on_time < self.window:
+                    self._switch(False)
+                next_time = self._sleep_until(window_start + self.window)
+
+    def _sleep_until(self, deadline):
+        """Sleep until deadline and return it, or now if we are more than a cycle late."""
+        now = time.monotonic()
+        if deadline > now:
+            sleep(deadline - now)
+            return deadline
+        if now - deadline > self.cycle:
+            return now
+        return deadline
@@ -0,0 +1,87 @@
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Field order of every frame. Clients get it with the config.
+FIELDS = ('time_stamp', 'temperature', 'target', 'heat', 'cost', 'state', 'total_time', 'profile', 'is_simulation',
+          'speed')
+
+KEYFRAME = 0
+DELTA = 1
+
+
+class TelemetryEncoder:
+    """
+    Encodes oven status dicts as compact frames for the oven_update stream.
+
+    A keyframe is [0, seq, value, value, ...] with every field in FIELDS order. A delta is
+    [1, seq, index, value, index, value, ...] with only the fields that changed since the previous frame.
+    A keyframe is sent every keyframe_interval frames so clients that miss a frame can recover.
+    Frames are serialized once, as json text or as MessagePack bytes, and sent as is to every client.
+    """
+
+    def __init__(self, keyframe_interval=30, use_msgpack=False):
+        self.keyframe_interval = keyframe_interval
+        if use_msgpack and msgpack is None:
+            log.warning("msgpack is not installed, sending telemetry as json")
+        self.use_msgpack = use_msgpack and msgpack is not None
+        self.seq = 0
+        self.values = None
+
+    def _serialize(self, frame):
+        if self.use_msgpack:
+            return msgpack.packb(frame)
+        return json.dumps(frame, separators=(',', ':'))
+
+    @staticmethod
+    def _value(value):
+        return round(value, 2) if isinstance(value, float) else value
+
+    def encode(self, status):
+        values = [self._value(status.get(field)) for field in FIELDS]
+        self.seq += 1
+        if self.values is None or self.seq % self.keyframe_interval == 0:
+            frame = [KEYFRAME, self.seq] + values
+        else:
+            frame = [DELTA, self.seq]
+            for index, (previous, value) in enumerate(zip(self.values, values)):
+                if value != previous:
+                    frame += [index, value]
+        self.values = values
+        return self._serialize(frame)
+
+    def keyframe(self):
+        """Return a keyframe of the latest status for a client that has to resync, None before the first frame."""
+        if self.values is None:
+            return None
+        return self._serialize([KEYFRAME, self.seq] + self.values)
+
+
+class TelemetryDecoder:
+    """Turns frames from a TelemetryEncoder back into status dicts."""
+
+    def __init__(self, fields=FIELDS):
+        self.fields = fields
+        self.seq = None
+        self.values = None
+
+    def decode(self, payload):
+        """Return the status dict of a frame, or None if a frame was missed and a keyframe is needed."""
+        frame = msgpack.unpackb(payload) if isinstance(payload, (bytes, bytearray)) else json.loads(payload)
+        kind, seq = frame[0], frame[1]
+        if kind == KEYFRAME:
+            self.values = list(frame[2:])
+        elif self.values is None or seq != self.seq + 1:
+            self.values = None
+            return None
+        else:
+            for index in range(2, len(frame), 2):
+                self.values[frame[index]] = frame[index + 1]
+        self.seq = seq
+        return dict(zip(self.fields, self.values))
@@ -0,0 +1,230 @@
+import bisect
+import collections
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class SortedWindow:
+    """
+    The last size values, kept both in arrival order and sorted.
+
+    Adding a value finds the insert and remove positions by bisection, so the cost per sample stays small
+    and flat as the window grows instead of sorting the whole window every time.
+    """
+
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError("window size must be at least 1")
+        self.size = size
+        self.values = collections.deque()
+        self.sorted = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, value):
+        """Add a value, return the one that dropped out of the window or None."""
+        removed = None
+        if len(self.values) == self.size:
+            removed = self.values.popleft()
+            del self.sorted[bisect.bisect_left(self.sorted, removed)]
+        self.values.append(value)
+        bisect.insort(self.sorted, value)
+        return removed
+
+    def median(self):
+        n = len(self.sorted)
+        middle = n // 2
+        return self.sorted[middle] if n % 2 else (self.sorted[middle - 1] + self.sorted[middle]) / 2
+
+    def clear(self):
+        self.values.clear()
+        self.sorted.clear()
+
+
+class TrimmedMean:
+    """
+    Mean of a sliding window of size samples, without the lowest and highest chop percent.
+
+    The sum of the kept values is updated as values enter and leave the window, only values crossing the
+    trim boundaries are added or subtracted, so an update doesn't walk the window.
+    """
+
+    def __init__(self, window=12, chop=20):
+        if not 0 <= chop < 50:
+            raise ValueError("chop must be between 0 and 50 percent")
+        self.window = SortedWindow(window)
+        self.chop = chop / 100
+        self.reset()
+
+    def reset(self):
+        self.window.clear()
+        # sum of self.window.sorted[self.low:self.high]
+        self.low = self.high = 0
+        self.total = 0.0
+        self._updates = 0
+
+    def _bounds(self):
+        n = len(self.window.sorted)
+        chop_count = int(n * self.chop)
+        return chop_count, n - chop_count
+
+    def _move_bounds(self):
+        # move the summed range to the trim boundaries of the new window length, at most a step or two each side
+        values = self.window.sorted
+        low, high = self._bounds()
+        while self.low > low:
+            self.low -= 1
+            self.total += values[self.low]
+        while self.low < low:
+            self.total -= values[self.low]
+            self.low += 1
+        while self.high < high:
+            self.total += values[self.high]
+            self.high += 1
+        while self.high > high:
+            self.high -= 1
+            self.total -= values[self.high]
+
+    def update(self, value):
+        values, ordered = self.window.values, self.window.sorted
+        if len(values) == self.window.size:
+            removed = values.popleft()
+            index = bisect.bisect_left(ordered, removed)
+            if index < self.low:
+                self.low -= 1
+                self.high -= 1
+            elif index < self.high:
+                self.total -= removed
+                self.high -= 1
+            del ordered[index]
+
+        values.append(value)
+        index = bisect.bisect_right(ordered, value)
+        ordered.insert(index, value)
+        if index < self.low:
+            self.low += 1
+            self.high += 1
+        elif index <= self.high:
+            self.total += value
+            self.high += 1
+        self._move_bounds()
+
+        # recompute now and then so float rounding can't add up
+        self._updates += 1
+        if self._updates >= 1000:
+            self._updates = 0
+            self.total = sum(ordered[self.low:self.high])
+        return self.value()
+
+    def value(self):
+        count = self.high - self.low
+        return self.total / count if count else 0
+
+
+class MedianSpikeFilter:
+    """Replaces a sample that is more than threshold away from the median of the last size samples with that median."""
+
+    def __init__(self, size=5, threshold=50):
+        self.window = SortedWindow(size)
+        self.threshold = threshold
+
+    def reset(self):
+        self.window.clear()
+
+    def update(self, value):
+        # once the window is more than half full its median can't be a spike itself
+        if len(self.window) > self.window.size // 2:
+            median = self.window.median()
+            if abs(value - median) > self.threshold:
+                log.debug(f"Rejected spike {value}, median {median}")
+                # keep the spike in the window, a real step change takes over once it is the median
+                self.window.add(value)
+                return median
+        self.window.add(value)
+        return value
+
+
+class ExponentialMovingAverage:
+    """Exponential moving average, alpha is the weight of the newest sample."""
+
+    def __init__(self, alpha=0.5):
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha must be in (0, 1]")
+        self.alpha = alpha
+        self.reset()
+
+    def reset(self):
+        self.average = None
+
+    def update(self, value):
+        if self.average is None:
+            self.average = value
+        else:
+            self.average += self.alpha * (value - self.average)
+        return self.average
+
+
+class KalmanFilter:
+    """
+    One dimensional Kalman filter for a slowly changing temperature. process_variance is how much the true
+    temperature may change between samples, measurement_variance is the noise of a reading.
+    """
+
+    def __init__(self, process_variance=0.05, measurement_variance=4.0):
+        self.process_variance = process_variance
+        self.measurement_variance = measurement_variance
+        self.reset()
+
+    def reset(self):
+        self.estimate = None
+        self.error = 1.0
+
+    def update(self, value):
+        if self.estimate is None:
+            self.estimate = value
+            self.error = self.measurement_variance
+            return value
+        error = self.error + self.process_variance
+        gain = error / (error + self.measurement_variance)
+        self.estimate += gain * (value - self.estimate)
+        self.error = (1 - gain) * error
+        return self.estimate
+
+
+FILTERS = {
+    'trimmed_mean': TrimmedMean,
+    'median': MedianSpikeFilter,
+    'ema': ExponentialMovingAverage,
+    'kalman': KalmanFilter,
+}
+
+
+class FilterChain:
+    """Passes every sample through the filters in order, one sample at a time."""
+
+    def __init__(self, filters):
+        self.filters = filters
+        self.value = None
+
+    @classmethod
+    def from_config(cls, filter_configs):
+        """Build the chain from a list of (name, {parameter: value}) tuples, see temperature_filters in config."""
+        filters = []
+        for name, parameters in filter_configs:
+            if name not in FILTERS:
+                raise ValueError(f"Unknown temperature filter {name}, use one of {', '.join(FILTERS)}")
+            filters.append(FILTERS[name](**parameters))
+        return cls(filters)
+
+    def reset(self):
+        self.value = None
+        for temperature_filter in self.filters:
+            temperature_filter.reset()
+
+    def update(self, value):
+        for temperature_filter in self.filters:
+            value = temperature_filter.update(value)
+        self.value = value
+        return value
@@ -1,15 +1,63 @@
-import collections
 import logging
 import time
-from gevent import sleep, Greenlet
+from gevent import monkey, sleep, Greenlet
+from gevent.threadpool import ThreadPool
+
+from lib.metrics import Histogram
+from lib.sample_ring import SampleRing
+from lib.temp_filter import FilterChain
 
 log = logging.getLogger(__name__)
 
 try:
-    from lib.max31855 import MAX31855
+    from lib.max31855 import MAX31855, MAX31855SPI
 except ImportError as e:
     log.warning(f"Could not import MAX31855: {e}")
-    MAX31855 = None  # Placeholder for the MAX31855 class
+    MAX31855 = MAX31855SPI = None  # Placeholder for the MAX31855 classes
+
+try:
+    import Adafruit_GPIO.SPI as SPI
+    from lib.max31856 import MAX31856
+except ImportError as e:
+    log.warning(f"Could not import MAX31856: {e}")
+    MAX31856 = SPI = None
+
+
+def create_thermocouple(configuration):
+    """
+    Return the driver of the thermocouple board set in config. Every driver has get(), which returns the
+    temperature in temp_scale units, and the noConnection, shortToGround, shortToVCC and unknownError flags
+    of the last reading.
+    """
+    board = configuration.thermocouple_board
+    interface = configuration.thermocouple_interface
+    if board == "max31855":
+        if interface == "spi":
+            log.info(f"Initializing MAX31855 on SPI {configuration.spi_bus}.{configuration.spi_device}")
+            return MAX31855SPI(configuration.spi_bus, configuration.spi_device, configuration.temp_scale)
+        log.info("Initializing MAX31855")
+        return MAX31855(configuration.gpio_sensor_cs,
+                        configuration.gpio_sensor_clock,
+                        configuration.gpio_sensor_data,
+                        configuration.temp_scale)
+
+    if board == "max31856":
+        if MAX31856 is None:
+            raise ImportError("Adafruit-GPIO is needed for the MAX31856")
+        tc_type = getattr(MAX31856, f"MAX31856_{configuration.thermocouple_type.upper()}_TYPE")
+        avgsel = MAX31856.AVERAGED_SAMPLES.index(configuration.thermocouple_hardware_averaging)
+        if interface == "spi":
+            log.info(f"Initializing MAX31856 on SPI {configuration.spi_bus}.{configuration.spi_device}")
+            spi = {'hardware_spi': SPI.SpiDev(configuration.spi_bus, configuration.spi_device)}
+        else:
+            log.info("Initializing MAX31856")
+            spi = {'software_spi': {'cs': configuration.gpio_sensor_cs, 'clk': configuration.gpio_sensor_clock,
+                                    'do': configuration.gpio_sensor_data, 'di': configuration.gpio_sensor_di}}
+        # converts continuously and averages on the chip, reads only fetch the latest result
+        return MAX31856(tc_type=tc_type, units=configuration.temp_scale, avgsel=avgsel,
+                        ac_freq_50hz=configuration.ac_freq_50hz, **spi)
+
+    raise ValueError(f"Unknown thermocouple board: {board}")
 
 
 class TempSensor(Greenlet):
@@ -20,6 +68,15 @@ class TempSensor(Greenlet):
         self.temperature = 0
         self.time_step = self.config.sensor_time_wait
         self.noConnection = self.shortToGround = self.shortToVCC = self.unknownError = False
+        # Histogram of thermocouple read times, for sensors that read one
+        self.read_latency = None
+
+    def stop(self):
+        pass
+
+    def get_stats(self):
+        """Return acquisition counters, empty for sensors that don't sample."""
+        return {}
 
 
 class TempSensorSimulated(TempSensor):
@@ -30,40 +87,88 @@ class TempSensorSimulated(TempSensor):
 
 
 class TempSensorReal(TempSensor):
+    """
+    Reads the thermocouple on its own OS thread, so slow reads (bit-banged SPI) never block the gevent hub
+    and the sample timing doesn't depend on how busy the hub is. Readings are timestamped and handed to the
+    greenlet through a SampleRing, the greenlet filters them and updates temperature once a second.
+    """
+
     def __init__(self, configuration):
         super().__init__(configuration)
-        self.sample_interval_seconds = 0.25  # Gather samples 4 times per second
+        self.sample_interval_seconds = self.config.temperature_sample_interval
         self.update_interval_seconds = 1  # Update temperature every 1 second
-        self.sliding_window_seconds = 3
-        # The deque length is based on how many samples are in the 3 second window
-        self.temps = collections.deque(maxlen=int(self.sliding_window_seconds / self.sample_interval_seconds))
-        self.last_update_time = time.monotonic()
-
-        log.info("Initializing MAX31855")
-        self.thermocouple = MAX31855(self.config.gpio_sensor_cs,
-                                     self.config.gpio_sensor_clock,
-                                     self.config.gpio_sensor_data,
-                                     self.config.temp_scale)
+        # every good reading goes through the filters as it arrives, temperature is the latest output
+        self.filters = FilterChain.from_config(self.config.temperature_filters)
+        # room for a few updates worth of samples, in case the hub is late
+        self.samples = SampleRing(4 * int(self.update_interval_seconds / self.sample_interval_seconds + 1))
+        self.running = True
+        # samples taken, taken after they were due, not taken because the thread fell a whole interval behind,
+        # failed reads and readings with a thermocouple fault
+        self.taken = self.late = self.skipped = self.read_errors = self.bad_reads = 0
+        self.read_latency = Histogram('sensor_read_seconds', 'Thermocouple read time',
+                                      (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+
+        self.thermocouple = create_thermocouple(self.config)
+        self._pool = ThreadPool(1)
+
+    def stop(self):
+        self.running = False
+
+    def get_stats(self):
+        return {'taken': self.taken, 'late': self.late, 'skipped': self.skipped, 'read_errors': self.read_errors,
+                'bad_reads': self.bad_reads, 'dropped': self.samples.dropped}
 
     def _run(self):
-        while True:
-            current_time = time.monotonic()
-
-            if current_time - self.last_update_time >= self.update_interval_seconds:
-                if self.temps:  # Ensure there are readings to calculate average
-                    self.temperature = self.get_avg_temp(list(self.temps))
-                self.last_update_time = current_time
-
-            temp, is_bad_value = self.read_temperature()
-
-            if not is_bad_value:
-                self.temps.append(temp)
-            else:
-                self.process_bad_temp()
-
-            sleep(self.sample_interval_seconds)
+        acquisition = self._pool.spawn(self._acquire)
+        try:
+            while self.running:
+                sleep(self.update_interval_seconds)
+                for timestamp, temp, faults in self.samples.get_all():
+                    if faults is None:
+                        self.filters.update(temp)
+                    else:
+                        self.process_bad_temp(faults)
+                if self.filters.value is not None:  # Ensure there are readings
+                    self.temperature = round(self.filters.value, 2)
+        finally:
+            # every oven has its own sensor, let the acquisition loop finish its read and end the pool's thread
+            self.running = False
+            acquisition.wait(self.update_interval_seconds)
+            self._pool.kill()
+
+    def _acquire(self):
+        # runs on the pool thread, sleep with the real time.sleep even if the time module is monkey patched
+        real_sleep = monkey.get_original('time', 'sleep')
+        interval = self.sample_interval_seconds
+        next_time = time.monotonic()
+        while self.running:
+            now = time.monotonic()
+            if now < next_time:
+                real_sleep(next_time - now)
+                now = time.monotonic()
+            if now - next_time > interval / 2:
+                self.late += 1
+                if now - next_time >= interval:
+                    # too far behind, skip the missed samples rather than reading them back to back
+                    missed = int((now - next_time) / interval)
+                    self.skipped += missed
+                    next_time += missed * interval
+            # deadlines stay on the start time grid, so the timing doesn't drift
+            next_time += interval
+
+            try:
+                temp, faults = self.read_temperature()
+            except Exception as e:
+                self.read_errors += 1
+                log.error(f"Error reading thermocouple: {e}")
+                continue
+            finally:
+                self.read_latency.observe(time.monotonic() - now)
+            self.taken += 1
+            self.samples.put((now, temp, faults))
 
     def read_temperature(self):
+        """Return the temperature and None, or the fault flags if the reading is bad."""
         temp = self.thermocouple.get()
         log.debug(f"Temp: {temp}")
 
@@ -71,21 +176,13 @@ class TempSensorReal(TempSensor):
         if not self.config.ignore_tc_short_errors:
             is_bad_value |= self.thermocouple.shortToGround or self.thermocouple.shortToVCC
 
-        return temp, is_bad_value
-
-    def process_bad_temp(self):
-        log.error(
-                f"Problem reading temp N/C:{self.thermocouple.noConnection} GND:{self.thermocouple.shortToGround} VCC:{self.thermocouple.shortToVCC} ???:"
-                f"{self.thermocouple.unknownError}")
-
-    @staticmethod
-    def get_avg_temp(temps, chop=20):
-        log.debug(f"Temps: {temps}")
-        if not temps:
-            return 0
+        if not is_bad_value:
+            return temp, None
+        return temp, (self.thermocouple.noConnection, self.thermocouple.shortToGround,
+                      self.thermocouple.shortToVCC, self.thermocouple.unknownError)
 
-        chop_percentage = chop / 100
-        temps = sorted(temps)
-        chop_count = int(len(temps) * chop_percentage)
-        temps = temps[chop_count:-chop_count]
-        return round(sum(temps) / len(temps), 2) if temps else 0
+    def process_bad_temp(self, faults):
+        self.bad_reads += 1
+        no_connection, short_to_ground, short_to_vcc, unknown_error = faults
+        log.error(f"Problem reading temp N/C:{no_connection} GND:{short_to_ground} VCC:{short_to_vcc} ???:"
+                  f"{unknown_error}")
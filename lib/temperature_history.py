@@ -0,0 +1,141 @@
+from array import array
+
+
+class TemperatureHistory:
+    """
+    Oven status samples of the current run, kept in a few MinMaxLevels of increasing resolution.
+
+    Each level is a fixed number of preallocated buckets, so memory stays the same however long a run is.
+    sample() answers in O(max_points) while keeping peaks and dips of the curve: while the most detailed level
+    still holds every sample and they fit max_points they are returned as they are, otherwise the coarsest
+    level with at least max_points / 2 buckets is merged down to that many buckets of two points each.
+    """
+
+    FIELDS = ('time_stamp', 'temperature', 'target', 'heat', 'cost')
+    LEVEL_CAPACITIES = (64, 256, 1024, 4096)
+
+    def __init__(self):
+        self.count = 0
+        self.levels = [MinMaxLevel(self.FIELDS, level_capacity) for level_capacity in self.LEVEL_CAPACITIES]
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+        for level in self.levels:
+            level.clear()
+
+    def append(self, status):
+        values = [status.get(field) or 0 for field in self.FIELDS]
+        for level in self.levels:
+            level.append(values)
+        self.count += 1
+
+    def sample(self, max_points=500):
+        """Return up to max_points samples as dicts, spread over the history."""
+        finest = self.levels[-1]
+        if self.count <= max_points and finest.bucket_size == 1:
+            return finest.get_points()
+
+        # two points per bucket: the coarsest level with enough buckets, merged down to max_points on read
+        buckets = max(max_points // 2, 1)
+        for level in self.levels:
+            if level.buckets >= buckets:
+                return level.get_points(buckets)
+        return finest.get_points()
+
+
+class MinMaxLevel:
+    """
+    The samples with the lowest and highest temperature of every bucket of bucket_size consecutive samples,
+    for at most capacity buckets. When full, neighbouring buckets are merged and bucket_size doubles.
+    Every bucket holds two rows in time order, both the same sample if the bucket only saw one.
+    """
+
+    def __init__(self, fields, capacity):
+        if capacity < 2 or capacity % 2:
+            raise ValueError("capacity must be an even number of at least 2")
+        self.fields = fields
+        self.temperature = fields.index('temperature')
+        self.capacity = capacity
+        self.rows = [array('d', bytes(8 * 2 * capacity)) for _ in fields]
+        self.clear()
+
+    def clear(self):
+        self.bucket_size = 1
+        self.buckets = 0
+        # samples in the last bucket, 0 once it is full
+        self.filled = 0
+        self.points = 0
+
+    def _row(self, row):
+        return [column[row] for column in self.rows]
+
+    def _set_bucket(self, bucket, first, second):
+        for column, first_value, second_value in zip(self.rows, first, second):
+            column[2 * bucket] = first_value
+            column[2 * bucket + 1] = second_value
+
+    def _bucket_points(self, bucket):
+        return 1 if self._row(2 * bucket) == self._row(2 * bucket + 1) else 2
+
+    def append(self, values):
+        if self.filled == 0:
+            if self.buckets == self.capacity:
+                self._compact()
+            self._set_bucket(self.buckets, values, values)
+            self.buckets += 1
+            self.points += 1
+        else:
+            bucket = self.buckets - 1
+            first, second = self._row(2 * bucket), self._row(2 * bucket + 1)
+            low, high = (first, second) if first[self.temperature] <= second[self.temperature] else (second, first)
+            temperature = values[self.temperature]
+            if temperature < low[self.temperature] or temperature > high[self.temperature]:
+                # the new sample replaces the extreme it beats and comes last in time
+                keep = high if temperature < low[self.temperature] else low
+                self.points += 2 - self._bucket_points(bucket)
+                self._set_bucket(bucket, keep, values)
+
+        self.filled = (self.filled + 1) % self.bucket_size
+
+    def _compact(self):
+        points = 0
+        for bucket in range(self.buckets // 2):
+            rows = [self._row(row) for row in range(4 * bucket, 4 * bucket + 4)]
+            low = min(range(4), key=lambda row: rows[row][self.temperature])
+            high = max(range(4), key=lambda row: rows[row][self.temperature])
+            first, second = sorted((low, high))
+            self._set_bucket(bucket, rows[first], rows[second])
+            points += self._bucket_points(bucket)
+        self.buckets //= 2
+        self.bucket_size *= 2
+        self.points = points
+
+    def get_points(self, buckets=None):
+        """Return the rows as dicts, with buckets, neighbouring buckets are merged into that many first."""
+        if buckets is not None and buckets < self.buckets:
+            return self._merged_points(buckets)
+        points = []
+        for row in range(2 * self.buckets):
+            if row % 2 and self._bucket_points(row // 2) == 1:
+                continue
+            points.append({field: column[row] for field, column in zip(self.fields, self.rows)})
+        return points
+
+    def _merged_points(self, buckets):
+        columns = list(zip(self.fields, self.rows))
+        temperatures = self.rows[self.temperature]
+        points = []
+        start = 0
+        for merged in range(buckets):
+            end = (merged + 1) * self.buckets // buckets
+            segment = temperatures[2 * start:2 * end]
+            # index finds the first of equal rows, so a one sample bucket is not returned twice
+            low = 2 * start + segment.index(min(segment))
+            high = 2 * start + segment.index(max(segment))
+            for row in sorted({low, high}):
+                points.append({field: column[row] for field, column in columns})
+            start = end
+        return points
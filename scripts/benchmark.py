@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the controller's hot paths.
+
+Every benchmark is timed over a number of rounds, each long enough to be measured reliably. The median time per
+operation of the rounds is compared, a single fast or slow round doesn't move it. Results are written as json and
+compared against a baseline, a benchmark that got more than --threshold slower fails the run, so regressions show
+up before they reach a kiln.
+
+    scripts/benchmark.py                       compare against scripts/benchmark_baseline.json
+    scripts/benchmark.py --save-baseline       record a new baseline
+    scripts/benchmark.py -k profile -k pid     run only benchmarks whose name contains one of the words
+
+Timings depend on the machine. The runner refuses to compare against a baseline from another machine type or
+Python version, record one on the machine being benchmarked. The committed baseline is from a development host,
+not from a Raspberry Pi. local_config is not needed, the benchmarks don't start the server.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+try:
+    import local_config  # noqa: F401
+except ImportError:
+    # local_config only holds the address the server listens on, config_file needs it to import
+    sys.modules['local_config'] = types.SimpleNamespace(ip_address='127.0.0.1', listening_port=8081)
+
+import config_file as config
+from lib.oven_watcher import OvenWatcher
+from lib.pid import PID
+from lib.profile import Profile
+from lib.profile_manager import ProfileManager
+from lib.simulated_oven import SimulatedOven
+from lib.telemetry import TelemetryEncoder
+from lib.temp_filter import FilterChain
+from lib.temperature_history import TemperatureHistory
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# a long glaze firing, used wherever a profile is needed so the results don't depend on storage/profiles
+PROFILE = {
+    'name': 'benchmark',
+    'type': 'profile',
+    'temp_units': 'f',
+    'data': [[0, 70], [3600, 250], [10800, 1000], [18000, 1900], [25200, 2232], [26100, 2232], [28800, 1900],
+             [32400, 1500], [36000, 1400], [39600, 1000]],
+}
+
+BENCHMARKS = {}
+# directories created by the benchmarks, removed at the end
+DIRECTORIES = []
+
+
+def benchmark(name):
+    """Register a benchmark. The function does the setup and returns (operation, operations per call)."""
+
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+def status(time_stamp):
+    return {'time_stamp': time_stamp, 'temperature': 1000 + time_stamp % 97 / 10, 'target': 1001.5,
+            'heat': time_stamp % 2, 'cost': time_stamp / 1000, 'state': 'RUNNING', 'total_time': 39600,
+            'profile': 'benchmark', 'is_simulation': True, 'speed': 1}
+
+
+@benchmark('profile.get_target_temperature')
+def bench_target_temperature():
+    profile = Profile(PROFILE)
+    times = [t * 3.7 for t in range(10000)]
+
+    def run():
+        for t in times:
+            profile.get_target_temperature(t)
+
+    return run, len(times)
+
+
+@benchmark('pid.compute')
+def bench_pid_compute():
+    now = [0.0]
+    pid = PID(configuration=config, time_function=lambda: now[0])
+    temperatures = [1000 + (i % 50) / 10 for i in range(10000)]
+
+    def run():
+        for temperature in temperatures:
+            now[0] += config.sensor_time_wait
+            pid.compute(1002, temperature)
+
+    return run, len(temperatures)
+
+
+def simulated_oven():
+    oven = SimulatedOven(config, speed=None)
+    # the oven greenlet never gets to run, the benchmarks don't yield to the hub
+    oven.kill(block=False)
+    return oven
+
+
+@benchmark('simulated_oven.simulate_temp_changes')
+def bench_simulate_temp_changes():
+    oven = simulated_oven()
+    oven.heat_energy = oven.p_heat * 0.5
+
+    def run():
+        for _ in range(10000):
+            oven.simulate_temp_changes()
+
+    return run, 10000
+
+
+@benchmark('oven.run_step')
+def bench_run_step():
+    oven = simulated_oven()
+    profile = Profile(PROFILE)
+
+    def run():
+        # the first 1000 seconds of the profile from a cold kiln, every call
+        oven.temperature = oven.element_temperature = config.simulated_room_temp
+        oven.run_profile(profile)
+        for _ in range(1000):
+            # like a simulation at full speed, this yields to the hub once per tick
+            oven.clock.sleep(oven.time_step)
+            oven.run_step()
+
+    return run, 1000
+
+
+@benchmark('temperature_filters.update')
+def bench_temperature_filters():
+    # replaces TempSensorReal.get_avg_temp, every sample goes through the configured filter chain
+    filters = FilterChain.from_config(config.temperature_filters)
+    samples = [1000 + (i * 7919 % 100) / 10 for i in range(10000)]
+
+    def run():
+        for sample in samples:
+            filters.update(sample)
+
+    return run, len(samples)
+
+
+@benchmark('oven_watcher.sampled_temp_history[50k]')
+def bench_sampled_temp_history():
+    watcher = OvenWatcher(None, config)
+    watcher.temperature_history = TemperatureHistory()
+    for time_stamp in range(50000):
+        watcher.temperature_history.append(status(time_stamp))
+
+    def run():
+        watcher.sampled_temp_history(500)
+
+    return run, 1
+
+
+def profile_directory(count):
+    path = tempfile.mkdtemp(prefix='kiln-benchmark-')
+    DIRECTORIES.append(path)
+    for index in range(count):
+        with open(os.path.join(path, f'profile-{index}.json'), 'w') as f:
+            json.dump(dict(PROFILE, name=f'profile-{index}'), f)
+    return path
+
+
+@benchmark('profile_manager.get_profiles[1000, cached]')
+def bench_get_profiles_cached():
+    manager = ProfileManager(profile_directory(1000))
+
+    def run():
+        # every call checks the directory for changes
+        manager.invalidate()
+        manager.get_profiles()
+
+    return run, 1
+
+
+@benchmark('profile_manager.get_profiles[1000, cold]')
+def bench_get_profiles_cold():
+    path = profile_directory(1000)
+
+    def run():
+        ProfileManager(path).get_profiles()
+
+    return run, 1
+
+
+@benchmark('telemetry.encode[json]')
+def bench_telemetry_json():
+    encoder = TelemetryEncoder(config.telemetry_keyframe_interval, use_msgpack=False)
+    statuses = [status(time_stamp) for time_stamp in range(10000)]
+
+    def run():
+        for oven_status in statuses:
+            encoder.encode(oven_status)
+
+    return run, len(statuses)
+
+
+@benchmark('telemetry.encode[msgpack]')
+def bench_telemetry_msgpack():
+    encoder = TelemetryEncoder(config.telemetry_keyframe_interval, use_msgpack=True)
+    statuses = [status(time_stamp) for time_stamp in range(10000)]
+
+    def run():
+        for oven_status in statuses:
+            encoder.encode(oven_status)
+
+    return run, len(statuses)
+
+
+def measure(setup, rounds, min_time):
+    run, operations = setup()
+    # calls per round, enough for a round to take min_time
+    run()
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        calls *= 2
+
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(calls):
+            run()
+        times.append((time.perf_counter() - start) / (calls * operations))
+    return {'median': statistics.median(times), 'min': min(times), 'max': max(times), 'rounds': rounds,
+            'operations': calls * operations}
+
+
+def compare(results, baseline, threshold):
+    """Print every result next to its baseline, return the names of the ones that got slower than threshold."""
+    regressions = []
+    print(f"{'benchmark':48} {'median':>12} {'baseline':>12} {'change':>8}")
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            print(f"{name:48} {result['median'] * 1e6:10.2f}us {'-':>12} {'-':>8}")
+            continue
+        change = result['median'] / reference['median'] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:48} {result['median'] * 1e6:10.2f}us {reference['median'] * 1e6:10.2f}us {change:+7.1%}{flag}")
+    return regressions
+
+
+def host(report):
+    """The machine type and Python version of a report, only reports of the same host can be compared."""
+    return report.get('machine'), '.'.join((report.get('python') or '').split('.')[:2])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the controller hot paths')
+    parser.add_argument('-k', dest='keywords', action='append', default=[],
+                        help="Only run benchmarks whose name contains this, may be given more than once.")
+    parser.add_argument('--rounds', type=int, default=15, help="Timed rounds per benchmark (default 15).")
+    parser.add_argument('--min-time', type=float, default=0.1, help="Minimum seconds per round (default 0.1).")
+    parser.add_argument('--output', help="Write the results to this json file.")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline json to compare against.")
+    parser.add_argument('--save-baseline', action='store_true', help="Write the results as the new baseline.")
+    parser.add_argument('--label', help="Where the results are from, e.g. 'kiln pi 4', kept in the json.")
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help="Fail if a benchmark is this much slower than the baseline (default 0.5, 50%%).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format=config.log_format)
+    # the benchmarks log nothing worth seeing, and logging would be part of the timings
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {}
+    try:
+        for name, setup in BENCHMARKS.items():
+            if args.keywords and not any(keyword in name for keyword in args.keywords):
+                continue
+            results[name] = measure(setup, args.rounds, args.min_time)
+    finally:
+        for path in DIRECTORIES:
+            shutil.rmtree(path, ignore_errors=True)
+
+    report = {
+        'label': args.label,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}, record one with --save-baseline")
+        baseline = {'results': {}}
+    if baseline['results'] and host(baseline) != host(report):
+        compare(results, {}, args.threshold)
+        sys.exit(f"The baseline ({baseline.get('label') or 'unlabelled'}) is from Python {baseline.get('python')} "
+                 f"on {baseline.get('machine')}, this is Python {report['python']} on {report['machine']}. Timings "
+                 f"of different machines can't be compared, record a baseline here with --save-baseline.")
+    regressions = compare(results, baseline['results'], args.threshold)
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,17 @@
 
 import argparse
 import csv
+import json
+import os
 import sys
 import time
 import logging
-import config
 
-from lib.oven import RealOven, SimulatedOven
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import config_file as config
+from lib.real_oven import RealOven
+from lib.simulated_oven import SimulatedOven
 
 log = logging.getLogger(__name__)
 logging.basicConfig(level=config.log_level, format=config.log_format)
@@ -33,9 +38,9 @@ def recordprofile(csvfile, targettemp):
 
     # construct the oven
     if SIMULATE:
-        oven = SimulatedOven()
+        oven = SimulatedOven(config)
     else:
-        oven = RealOven()
+        oven = RealOven(config)
 
     # Main loop:
     #
@@ -48,7 +53,7 @@ def recordprofile(csvfile, targettemp):
     try:
         stage = 'heating'
         if not SIMULATE:
-            oven.output.heat(sleep_for=0)
+            oven.ssr.set_duty(1)
 
         while True:
             oven.update_temperature()
@@ -60,7 +65,7 @@ def recordprofile(csvfile, targettemp):
             if stage == 'heating':
                 if temp >= targettemp:
                     if not SIMULATE:
-                        oven.output.cool(0)
+                        oven.ssr.off()
                     stage = 'cooling'
 
             elif stage == 'cooling':
@@ -75,7 +80,7 @@ def recordprofile(csvfile, targettemp):
     finally:
         # ensure we always shut the oven down!
         if not SIMULATE:
-            oven.output.cool(0)
+            oven.ssr.off()
 
 
 def line(a, b, x):
@@ -174,6 +179,59 @@ def calculate(filename, tangentdivisor, showplot):
              lower_crossing_x, upper_crossing_x)
 
 
+def load_profile(profile):
+    # profile is either the name of a saved profile or the path to a profile json file
+    if profile.endswith('.json'):
+        with open(profile) as f:
+            return json.load(f)
+    from lib.profile_manager import ProfileManager
+    profile_dict = ProfileManager(config.kiln_profiles_directory).find_profile(profile)
+    if profile_dict is None:
+        raise ValueError("Unknown profile %s" % profile)
+    return profile_dict
+
+
+def verify(profile_dict, candidate):
+    # re-run a candidate through SimulatedOven and lib/pid.PID as a check on the batch simulation
+    import gevent
+    from lib.pid_search import config_snapshot
+    from lib.profile import Profile
+
+    configuration = config_snapshot(config, pid_kp=candidate['kp'], pid_ki=candidate['ki'], pid_kd=candidate['kd'])
+    oven = SimulatedOven(configuration, speed=None)
+    oven.run_profile(Profile(profile_dict))
+    while oven.state == "RUNNING":
+        gevent.sleep(1)
+    oven.die()
+    return oven.state, oven.cost
+
+
+def search(profile, strategy, span, steps, rounds, overshoot_weight, switch_weight, processes, top):
+    from lib.pid_search import search as search_gains
+
+    profile_dict = load_profile(profile)
+    started = time.time()
+    candidates = search_gains(config, profile_dict, strategy=strategy, span=span, steps=steps, rounds=rounds,
+                              overshoot_weight=overshoot_weight, switch_weight=switch_weight,
+                              processes=processes)
+    log.info("evaluated %d candidates in %.1fs" % (len(candidates), time.time() - started))
+
+    print("%12s %12s %12s %10s %10s %10s %10s %8s" % (
+        "kp", "ki", "kd", "score", "rms_err", "overshoot", "switches", "state"))
+    for candidate in candidates[:top]:
+        print("%12.5g %12.5g %12.5g %10.3f %10.3f %10.3f %10d %8s" % (
+            candidate['kp'], candidate['ki'], candidate['kd'], candidate['score'], candidate['rms_error'],
+            candidate['max_overshoot'], candidate['switches'], candidate['state']))
+
+    best = candidates[0]
+    state, cost = verify(profile_dict, best)
+    log.info("best candidate re-run with SimulatedOven: state = %s, cost = %s%.2f" % (state, config.currency_type, cost))
+
+    print("pid_kp = %s" % (best['kp']))
+    print("pid_ki = %s" % (best['ki']))
+    print("pid_kd = %s" % (best['kd']))
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Kiln tuner')
     subparsers = parser.add_subparsers()
@@ -191,6 +249,19 @@ if __name__ == "__main__":
     parser_zn.add_argument('--tangentdivisor', type=float, default=8, help="Adjust the tangent calculation to fit better. Must be >= 2 (default 8).")
     parser_zn.set_defaults(mode='zn')
 
+    parser_search = subparsers.add_parser('search', help='Search PID parameters by simulating the kiln over a profile')
+    parser_search.add_argument('profile', type=str, help="Name of a saved profile, or path to a profile json file.")
+    parser_search.add_argument('--strategy', choices=['grid', 'adaptive'], default='adaptive',
+                               help="grid evaluates one grid, adaptive keeps refining around the best candidate (default adaptive).")
+    parser_search.add_argument('--span', type=float, default=10, help="Search from gain / span to gain * span around config.py (default 10).")
+    parser_search.add_argument('--steps', type=int, default=8, help="Grid points per gain, steps^3 candidates per round (default 8).")
+    parser_search.add_argument('--rounds', type=int, default=4, help="Refinement rounds in adaptive mode (default 4).")
+    parser_search.add_argument('--overshoot_weight', type=float, default=0.5, help="Score penalty per degree of overshoot (default 0.5).")
+    parser_search.add_argument('--switch_weight', type=float, default=0.001, help="Score penalty per relay switch per hour (default 0.001).")
+    parser_search.add_argument('--processes', type=int, default=None, help="Worker processes (default all cores).")
+    parser_search.add_argument('--top', type=int, default=10, help="Number of candidates to show (default 10).")
+    parser_search.set_defaults(mode='search')
+
     args = parser.parse_args()
 
     if args.mode == 'recordprofile':
@@ -202,6 +273,10 @@ if __name__ == "__main__":
 
         calculate(args.csv_file, args.tangentdivisor, args.showplot)
 
+    elif args.mode == 'search':
+        search(args.profile, args.strategy, args.span, args.steps, args.rounds, args.overshoot_weight,
+               args.switch_weight, args.processes, args.top)
+
     elif args.mode == '':
         parser.print_help()
         exit(1)
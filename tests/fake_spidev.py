@@ -0,0 +1,44 @@
+class FakeSpiDev:
+    """
+    Stands in for spidev.SpiDev without hardware. Every read returns the frame a MAX31855 would send for
+    the current temperature, internal (cold junction) temperature and fault.
+    """
+
+    # fault bits of the MAX31855 frame
+    OPEN_CIRCUIT = 0x1
+    SHORT_TO_GROUND = 0x2
+    SHORT_TO_VCC = 0x4
+
+    def __init__(self, temperature=25.0, internal_temperature=25.0, fault=0):
+        self.temperature = temperature
+        self.internal_temperature = internal_temperature
+        self.fault = fault
+        self.bus = self.device = None
+        self.max_speed_hz = 0
+        self.mode = 0
+        self.transfers = 0
+
+    def open(self, bus, device):
+        self.bus = bus
+        self.device = device
+
+    def close(self):
+        self.bus = self.device = None
+
+    def frame(self):
+        """Return the 32 bit frame for the current values."""
+        thermocouple = round(self.temperature / 0.25) & 0x3FFF
+        internal = round(self.internal_temperature / 0.0625) & 0xFFF
+        data = thermocouple << 18 | internal << 4 | self.fault
+        if self.fault:
+            data |= 0x10000
+        return data
+
+    def readbytes(self, length):
+        if self.bus is None:
+            raise OSError("SPI device is not open")
+        self.transfers += 1
+        return list(self.frame().to_bytes(4, "big"))[:length]
+
+    def xfer2(self, data):
+        return self.readbytes(len(data))
@@ -0,0 +1,91 @@
+import pytest
+
+from fake_spidev import FakeSpiDev
+from lib.max31855 import MAX31855SPI
+
+
+def thermocouple(temperature=25.0, internal_temperature=25.0, fault=0, units="c"):
+    return MAX31855SPI(units=units, spi=FakeSpiDev(temperature, internal_temperature, fault))
+
+
+def test_opens_the_device():
+    spi = FakeSpiDev()
+    MAX31855SPI(bus=0, device=1, max_speed_hz=1000000, spi=spi)
+    assert (spi.bus, spi.device, spi.max_speed_hz, spi.mode) == (0, 1, 1000000, 0)
+
+
+@pytest.mark.parametrize("temperature", [0.0, 25.25, 100.0, 1200.0, 1372.75])
+def test_positive_temperature(temperature):
+    sensor = thermocouple(temperature)
+    sensor.read()
+    assert sensor.data_to_tc_temperature() == temperature
+
+
+@pytest.mark.parametrize("temperature", [-0.25, -50.0, -100.5, -270.0])
+def test_negative_temperature(temperature):
+    sensor = thermocouple(temperature)
+    sensor.read()
+    assert sensor.data_to_tc_temperature() == temperature
+
+
+@pytest.mark.parametrize("internal_temperature", [25.0, 0.0625, -10.5, -40.0, 85.0])
+def test_internal_temperature(internal_temperature):
+    assert thermocouple(internal_temperature=internal_temperature).get_rj() == internal_temperature
+
+
+def test_linearized_temperature():
+    # the NIST correction of a K type thermocouple moves the reading by a little near room temperature
+    assert thermocouple(100.0).get() == pytest.approx(100.0, abs=0.5)
+    assert thermocouple(1200.0).get() == pytest.approx(1218.1, abs=0.5)
+    assert thermocouple(-50.0).get() < 0
+
+
+def test_units():
+    assert thermocouple(internal_temperature=25.0, units="f").get_rj() == 77.0
+    assert thermocouple(internal_temperature=25.0, units="k").get_rj() == 298.15
+
+
+def test_no_fault():
+    sensor = thermocouple(100.0)
+    sensor.get()
+    assert not (sensor.noConnection or sensor.shortToGround or sensor.shortToVCC or sensor.unknownError)
+
+
+@pytest.mark.parametrize("fault, flag", [
+    (FakeSpiDev.OPEN_CIRCUIT, "noConnection"),
+    (FakeSpiDev.SHORT_TO_GROUND, "shortToGround"),
+    (FakeSpiDev.SHORT_TO_VCC, "shortToVCC"),
+    # fault bit set without any of the fault flags
+    (0x8, "unknownError"),
+])
+def test_fault_flags(fault, flag):
+    sensor = thermocouple(fault=fault)
+    sensor.get()
+    flags = {name: getattr(sensor, name) for name in ("noConnection", "shortToGround", "shortToVCC", "unknownError")}
+    assert flags == {name: name == flag for name in flags}
+
+
+def test_fault_clears():
+    spi = FakeSpiDev(fault=FakeSpiDev.OPEN_CIRCUIT)
+    sensor = MAX31855SPI(spi=spi)
+    sensor.get()
+    assert sensor.noConnection
+    spi.fault = 0
+    sensor.get()
+    assert not sensor.noConnection
+
+
+def test_one_transfer_per_read():
+    spi = FakeSpiDev()
+    sensor = MAX31855SPI(spi=spi)
+    sensor.get()
+    sensor.get_rj()
+    assert spi.transfers == 2
+
+
+def test_cleanup_closes_the_device():
+    spi = FakeSpiDev()
+    sensor = MAX31855SPI(spi=spi)
+    sensor.cleanup()
+    with pytest.raises(OSError):
+        sensor.read()
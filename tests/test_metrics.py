@@ -0,0 +1,19 @@
+from lib.metrics import Registry
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.gauge('kiln_temperature', 'Temperature', lambda: {'a "b"\\c\nd': 1}, label='kiln')
+    assert 'kiln_temperature{kiln="a \\"b\\"\\\\c\\nd"} 1\n' in registry.render()
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram('tick_seconds', 'Tick time', (0.1, 1))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value)
+    lines = registry.render().splitlines()
+    assert 'tick_seconds_bucket{le="0.1"} 1' in lines
+    assert 'tick_seconds_bucket{le="1"} 2' in lines
+    assert 'tick_seconds_bucket{le="+Inf"} 3' in lines
+    assert 'tick_seconds_count 3' in lines
@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+from lib.profile import Profile
+
+PROFILE = {
+    'name': 'test',
+    'data': [[0, 70], [3600, 250], [3600, 300], [10800, 1000], [18000, 1900], [25200, 2232], [26100, 2232],
+             [28800, 1900], [39600, 1000]],
+}
+
+
+def linear_scan(profile_dict, runtime):
+    """The target temperature the way it was found before the cursor, by walking the points from the start."""
+    points = sorted(profile_dict['data'], key=lambda point: point[0])
+    if not points or runtime > points[-1][0] or runtime < points[0][0]:
+        return 0
+    prev_point, next_point = (points[-2], points[-1]) if len(points) > 1 else (None, None)
+    for i in range(1, len(points)):
+        if runtime < points[i][0]:
+            prev_point, next_point = points[i - 1], points[i]
+            break
+    if prev_point is None or prev_point[0] == next_point[0]:
+        return 0
+    slope = (float(next_point[1]) - float(prev_point[1])) / (float(next_point[0]) - float(prev_point[0]))
+    return round(prev_point[1] + (runtime - prev_point[0]) * slope, 2)
+
+
+@pytest.mark.parametrize("times", [
+    [t * 7.3 for t in range(6000)],
+    [t * 7.3 for t in reversed(range(6000))],
+    [0, 3599.9, 3600, 3600.1, 39600, 39600.5, -1],
+    [random.Random(seed).uniform(-100, 40000) for seed in range(2000)],
+], ids=["forward", "backward", "edges", "random"])
+def test_cursor_matches_linear_scan(times):
+    profile = Profile(PROFILE)
+    for runtime in times:
+        assert profile.get_target_temperature(runtime) == linear_scan(PROFILE, runtime), runtime
+
+
+def test_jumps_ahead_and_back():
+    profile = Profile(PROFILE)
+    for runtime in (100, 30000, 200, 39000, 3700, 3700):
+        assert profile.get_target_temperature(runtime) == linear_scan(PROFILE, runtime)
+
+
+def test_target_temperatures_match():
+    profile = Profile(PROFILE)
+    times = [t * 13.1 for t in range(-10, 3100)]
+    # numpy rounds halves to even, a target may differ in the last digit
+    assert list(profile.get_target_temperatures(times)) == pytest.approx([linear_scan(PROFILE, t) for t in times],
+                                                                         abs=0.011)
+
+
+def test_short_profiles():
+    assert Profile({'name': 'empty', 'data': []}).get_target_temperature(0) == 0
+    assert Profile({'name': 'point', 'data': [[0, 100]]}).get_target_temperature(0) == 0
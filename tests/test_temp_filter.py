@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+from lib.temp_filter import TrimmedMean
+
+
+def brute_force(values, window, chop):
+    """Mean of the last window values without the lowest and highest chop percent, sorting the window."""
+    ordered = sorted(values[-window:])
+    chop_count = int(len(ordered) * chop / 100)
+    kept = ordered[chop_count:len(ordered) - chop_count]
+    return sum(kept) / len(kept) if kept else 0
+
+
+@pytest.mark.parametrize("window, chop", [(1, 0), (5, 0), (12, 20), (12, 49), (25, 10), (60, 33)])
+def test_matches_brute_force(window, chop):
+    rng = random.Random(window * 100 + chop)
+    trimmed = TrimmedMean(window, chop)
+    values = []
+    for _ in range(3000):
+        # few distinct values, so equal values often enter and leave the window together
+        value = rng.choice([rng.uniform(0, 1300), float(rng.randint(0, 10)), 1000.0])
+        values.append(value)
+        assert trimmed.update(value) == pytest.approx(brute_force(values, window, chop), abs=1e-6)
+
+
+def test_spike_is_trimmed():
+    trimmed = TrimmedMean(10, 20)
+    for _ in range(10):
+        trimmed.update(500.0)
+    assert trimmed.update(5000.0) == 500.0
+
+
+def test_reset():
+    trimmed = TrimmedMean(5, 20)
+    for value in (1.0, 2.0, 3.0):
+        trimmed.update(value)
+    trimmed.reset()
+    assert trimmed.value() == 0
+    assert trimmed.update(7.0) == 7.0
+
+
+def test_chop_must_be_below_half():
+    with pytest.raises(ValueError):
+        TrimmedMean(12, 50)
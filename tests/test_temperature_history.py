@@ -0,0 +1,95 @@
+import random
+
+import pytest
+
+from lib.temperature_history import MinMaxLevel, TemperatureHistory
+
+FIELDS = TemperatureHistory.FIELDS
+
+
+def samples(count, seed=0):
+    # distinct temperatures, so the coolest and hottest sample of a bucket are never a tie
+    temperatures = random.Random(seed).sample(range(count * 10), count)
+    return [[float(time_stamp), float(temperature), 0.0, 0.0, 0.0]
+            for time_stamp, temperature in enumerate(temperatures)]
+
+
+def brute_force(rows, capacity):
+    """The coolest and hottest row of every bucket, with the bucket size the level ends up with."""
+    bucket_size = 1
+    while len(rows) > capacity * bucket_size:
+        bucket_size *= 2
+    points = []
+    for start in range(0, len(rows), bucket_size):
+        bucket = rows[start:start + bucket_size]
+        extremes = {min(bucket, key=lambda row: row[1])[0], max(bucket, key=lambda row: row[1])[0]}
+        points.extend(row for row in bucket if row[0] in extremes)
+    return points
+
+
+@pytest.mark.parametrize("capacity", [2, 8, 64])
+@pytest.mark.parametrize("count", [1, 2, 7, 8, 9, 64, 65, 300, 1000])
+def test_min_max_level_matches_brute_force(capacity, count):
+    rows = samples(count, seed=count)
+    level = MinMaxLevel(FIELDS, capacity)
+    for row in rows:
+        level.append(row)
+    expected = brute_force(rows, capacity)
+    points = level.get_points()
+    assert [[point[field] for field in FIELDS] for point in points] == expected
+    assert level.points == len(points)
+
+
+def test_min_max_level_clear():
+    level = MinMaxLevel(FIELDS, 4)
+    for row in samples(100):
+        level.append(row)
+    level.clear()
+    assert (level.buckets, level.bucket_size, level.points, level.get_points()) == (0, 1, 0, [])
+
+
+def test_min_max_level_capacity():
+    with pytest.raises(ValueError):
+        MinMaxLevel(FIELDS, 3)
+
+
+@pytest.mark.parametrize("buckets", [1, 3, 10, 33])
+def test_min_max_level_merged(buckets):
+    rows = samples(500, seed=buckets)
+    level = MinMaxLevel(FIELDS, 64)
+    for row in rows:
+        level.append(row)
+    points = level.get_points(buckets)
+    time_stamps = [point['time_stamp'] for point in points]
+    assert time_stamps == sorted(set(time_stamps))
+    assert len(points) <= 2 * buckets
+    temperatures = [point['temperature'] for point in points]
+    assert min(temperatures) == min(row[1] for row in rows)
+    assert max(temperatures) == max(row[1] for row in rows)
+
+
+@pytest.mark.parametrize("count", [10, 499, 501, 2000, 30000])
+def test_sample_fills_max_points(count):
+    history = TemperatureHistory()
+    rows = samples(count)
+    for row in rows:
+        history.append(dict(zip(FIELDS, row)))
+    points = history.sample(500)
+    time_stamps = [point['time_stamp'] for point in points]
+    assert time_stamps == sorted(set(time_stamps))
+    # a bucket with a single sample adds one point instead of two
+    assert min(count, 450) <= len(points) <= 500
+    temperatures = [point['temperature'] for point in points]
+    assert min(temperatures) == min(row[1] for row in rows)
+    assert max(temperatures) == max(row[1] for row in rows)
+
+
+def test_sample_returns_short_runs_whole():
+    history = TemperatureHistory()
+    rows = samples(300)
+    for row in rows:
+        history.append(dict(zip(FIELDS, row)))
+    assert len(history) == 300
+    assert [[point[field] for field in FIELDS] for point in history.sample(500)] == rows
+    history.clear()
+    assert (len(history), history.sample(500)) == (0, [])